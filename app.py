@@ -22,8 +22,12 @@ app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "development_secret_key")
 # configure the database, relative to the app instance folder
 app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL")
+# The bot's worker threads and the web app share this engine, so allow enough
+# connections for concurrent database calls
 app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
+    "pool_size": int(os.environ.get("DB_POOL_SIZE", 10)),
+    "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", 20)),
+    "pool_recycle": 1800,
     "pool_pre_ping": True,
 }
 # initialize the app with the extension, flask-sqlalchemy >= 3.0.x
@@ -16,6 +16,7 @@ from handlers import (
     block_user, report_user, unmatch_user, show_matches, profile_completed,
     edit_profile_command, match_command, handle_photo
 )
+from chat_writer import chat_writer
 
 # Enable logging
 logging.basicConfig(
@@ -29,6 +30,11 @@ logger = logging.getLogger(__name__)
 NAME, AGE, GENDER, PROFILE_PIC, UNIVERSITY, TARGET_UNIVERSITIES, HOBBIES, BIO, RELATIONSHIP_PREFERENCE, COMPLETED = range(10)
 
 
+async def flush_chat_messages():
+    """Write any chat messages still queued in memory to the database."""
+    await chat_writer.flush()
+
+
 def setup_bot():
     """Setup and configure the bot with all required handlers"""
     
@@ -8,10 +8,12 @@ Standalone entry point for the GBI Match Maker Telegram bot
 import logging
 import asyncio
 import os
+import signal
 import time
 import aiohttp
 from aiohttp import web
-from bot import setup_bot
+from bot import setup_bot, flush_chat_messages
+from outbox import outbox
 
 # Enable logging
 logging.basicConfig(
@@ -26,10 +28,15 @@ async def healthcheck(request):
     """Simple health check endpoint."""
     return web.Response(text="GBI Match Maker Bot is running!", content_type="text/plain")
 
+async def status(request):
+    """API status endpoint."""
+    return web.json_response({"status": "running"})
+
 async def setup_health_server():
     """Set up a simple health check server."""
     app = web.Application()
     app.router.add_get('/', healthcheck)
+    app.router.add_get('/status', status)
     
     port = int(os.environ.get('PORT', 5000))
     runner = web.AppRunner(app)
@@ -48,20 +55,23 @@ async def self_ping():
     
     logger.info(f"Self-ping service will ping {app_url} every 13 minutes")
     
-    while True:
-        try:
-            # Wait for 13 minutes (780 seconds)
-            await asyncio.sleep(780)
-            
-            # Ping the application
-            async with aiohttp.ClientSession() as session:
+    # One session for all pings so the connection pool is reused
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30)) as session:
+        while True:
+            try:
+                # Wait for 13 minutes (780 seconds)
+                await asyncio.sleep(780)
+                
+                # Ping the application
                 start_time = time.time()
-                async with session.get(app_url) as response:
+                # HEAD is enough to keep the service awake; no body is transferred
+                async with session.head(app_url, allow_redirects=False,
+                                        timeout=aiohttp.ClientTimeout(total=10)) as response:
                     elapsed = time.time() - start_time
                     logger.info(f"Self-ping to {app_url} completed with status {response.status} in {elapsed:.2f}s")
-        except Exception as e:
-            logger.error(f"Error in self-ping to {app_url}: {str(e)}", exc_info=True)
-            # Continue the loop even if there's an error
+            except Exception as e:
+                logger.error(f"Error in self-ping to {app_url}: {str(e)}", exc_info=True)
+                # Continue the loop even if there's an error
 
 async def main():
     """Run the bot and health check server."""
@@ -71,7 +81,7 @@ async def main():
         bot_app = setup_bot()
         await bot_app.initialize()
         await bot_app.start()
-        await bot_app.updater.start_polling()
+        await bot_app.updater.start_polling(poll_interval=0.0, timeout=20, bootstrap_retries=-1)
         logger.info("Bot is running...")
         
         # Set up health check server
@@ -81,8 +91,20 @@ async def main():
         asyncio.create_task(self_ping())
         logger.info("Self-ping service started")
         
-        # Keep the bot running until manually stopped
-        await asyncio.Event().wait()  # Run forever
+        # Keep the bot running until the process is asked to stop
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop_event.set)
+        await stop_event.wait()
+        
+        logger.info("Stopping the Telegram bot...")
+        await bot_app.updater.stop()
+        # Deliver notifications still waiting for their slot while the bot can send
+        await outbox.drain()
+        await bot_app.stop()
+        await bot_app.shutdown()
+        await flush_chat_messages()
     except Exception as e:
         logger.error(f"Error running bot: {e}", exc_info=True)
 
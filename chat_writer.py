@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Batched background persistence of chat messages
+"""
+
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+from data_store import add_chat_message_to_memory, save_chat_messages_to_db
+
+# Enable logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+
+logger = logging.getLogger(__name__)
+
+# Flush once this many messages are waiting, or after this many seconds
+CHAT_BATCH_SIZE = 100
+CHAT_FLUSH_INTERVAL_SECONDS = 0.5
+
+
+class ChatWriter:
+    """Records chat messages in memory immediately and writes them to the database in batches."""
+
+    def __init__(self, batch_size: int = CHAT_BATCH_SIZE, flush_interval: float = CHAT_FLUSH_INTERVAL_SECONDS):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._batch: List[Dict[str, Any]] = []  # Messages taken off the queue but not yet written
+
+    def enqueue(self, sender_id: int, recipient_id: int, text: str) -> None:
+        """Add a message to the chat history and queue it for the next database write."""
+        message = add_chat_message_to_memory(sender_id, recipient_id, text)
+
+        # Start the flush loop lazily on the bot's running event loop
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush_loop())
+
+        self._queue.put_nowait(message)
+
+    async def _fill_batch(self) -> None:
+        """Wait for a message, then collect more until the batch is full or the interval passes."""
+        self._batch.append(await self._queue.get())
+        deadline = asyncio.get_running_loop().time() + self.flush_interval
+
+        while len(self._batch) < self.batch_size:
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                break
+            try:
+                self._batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+
+    async def _flush_loop(self) -> None:
+        """Write queued messages to the database until cancelled."""
+        while True:
+            await self._fill_batch()
+            batch, self._batch = self._batch, []
+            try:
+                await asyncio.to_thread(save_chat_messages_to_db, batch)
+            except Exception as e:
+                logger.error(f"Error flushing chat messages: {e}", exc_info=True)
+
+    async def flush(self) -> None:
+        """Stop the flush loop and write any messages still waiting (used on shutdown)."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        if self._queue is None:
+            return
+
+        batch, self._batch = self._batch, []
+        while not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+
+        if batch:
+            logger.info(f"Flushing {len(batch)} pending chat messages")
+            await asyncio.to_thread(save_chat_messages_to_db, batch)
+
+
+chat_writer = ChatWriter()
@@ -7,8 +7,11 @@ In-memory data storage for user profiles, matches, and chats
 
 import logging
 from typing import Dict, List, Any, Optional, Set, Tuple, Union
+import asyncio
 import time
 import random
+from collections import OrderedDict
+from datetime import datetime
 from constants import UNIVERSITY_LIST
 
 # Enable logging
@@ -27,6 +30,31 @@ blocks: Dict[int, Set[int]] = {}  # user_id -> set of users they've blocked
 reports: Dict[int, List[int]] = {}  # user_id -> list of users they've reported
 secret_crushes: Dict[int, Set[int]] = {}  # user_id -> set of secret crushes
 chats: Dict[tuple, List[Dict[str, Any]]] = {}  # (user1_id, user2_id) -> list of chat messages
+missing_profiles: Set[int] = set()  # user_ids known to have no profile in memory or database
+users_version = 0  # Bumped whenever a new user is added to the database
+
+# Recently fetched profile photos (user_id -> bytes or None), least recently used first
+PROFILE_PIC_CACHE_SIZE = 64
+profile_pic_cache: "OrderedDict[int, Optional[bytes]]" = OrderedDict()
+
+
+def _profile_from_db_user(db_user) -> Dict[str, Any]:
+    """Build an in-memory profile dict from a User row (the photo bytes stay in the database)."""
+    return {
+        "telegram_id": db_user.telegram_id,
+        "name": db_user.name,
+        "age": db_user.age,
+        "gender": db_user.gender,
+        "university": db_user.university,
+        "bio": db_user.bio or "",
+        "hobbies": db_user.hobbies or "",
+        "relationship_preference": db_user.relationship_preference or "",
+        "profile_pic_url": db_user.profile_pic_url or "",
+        "profile_pic_file_id": db_user.profile_pic_file_id or "",
+        "profile_complete": True,  # If in DB, it's complete
+        "target_universities": [target_uni.university_name for target_uni in db_user.target_universities],
+        "username": db_user.username or ""
+    }
 
 
 def load_data_from_db():
@@ -38,85 +66,67 @@ def load_data_from_db():
         
         # Use Flask application context
         with app.app_context():
-            # Load users
+            # Load users (target universities come in one batched query)
             db_users = db.session.query(User).all()
             logger.info(f"Found {len(db_users)} users in database")
             
+            # Database ID -> Telegram ID, so the tables below need no per-row user lookups
+            telegram_ids = {}
             for user in db_users:
-                logger.info(f"Loading user {user.telegram_id} from database")
-                # Create basic profile
-                user_profile = {
-                    "name": user.name,
-                    "age": user.age,
-                    "gender": user.gender,
-                    "university": user.university,
-                    "bio": user.bio or "",
-                    "hobbies": user.hobbies or "",
-                    "relationship_preference": user.relationship_preference or "",
-                    "profile_pic_url": user.profile_pic_url or "",
-                    "profile_pic": user.profile_pic or "",
-                    "profile_complete": True,  # If in DB, it's complete
-                    "target_universities": [],
-                    "username": ""  # Initialize username field
-                }
-                
-                # Get target universities
-                for target_uni in user.target_universities:
-                    user_profile["target_universities"].append(target_uni.university_name)
-                
                 # Store in memory
-                user_profiles[user.telegram_id] = user_profile
+                user_profiles[user.telegram_id] = _profile_from_db_user(user)
+                telegram_ids[user.id] = user.telegram_id
             
             # Load matches from likes
-            db_likes = db.session.query(Like).all()
-            for like in db_likes:
+            db_likes = db.session.query(Like.sender_id, Like.receiver_id, Like.is_match).all()
+            for sender_db_id, receiver_db_id, is_match in db_likes:
                 # Get telegram IDs
-                sender = db.session.query(User).filter_by(id=like.sender_id).first()
-                receiver = db.session.query(User).filter_by(id=like.receiver_id).first()
+                sender_id = telegram_ids.get(sender_db_id)
+                receiver_id = telegram_ids.get(receiver_db_id)
                 
-                if sender and receiver:
+                if sender_id and receiver_id:
                     # Add to likes
-                    if sender.telegram_id not in likes:
-                        likes[sender.telegram_id] = set()
-                    likes[sender.telegram_id].add(receiver.telegram_id)
+                    if sender_id not in likes:
+                        likes[sender_id] = set()
+                    likes[sender_id].add(receiver_id)
                     
                     # If it's a match, add to matches
-                    if like.is_match:
-                        if sender.telegram_id not in matches:
-                            matches[sender.telegram_id] = set()
-                        if receiver.telegram_id not in matches:
-                            matches[receiver.telegram_id] = set()
+                    if is_match:
+                        if sender_id not in matches:
+                            matches[sender_id] = set()
+                        if receiver_id not in matches:
+                            matches[receiver_id] = set()
                         
-                        matches[sender.telegram_id].add(receiver.telegram_id)
-                        matches[receiver.telegram_id].add(sender.telegram_id)
+                        matches[sender_id].add(receiver_id)
+                        matches[receiver_id].add(sender_id)
             
             # Load secret crushes
-            db_crushes = db.session.query(SecretCrush).all()
-            for crush in db_crushes:
+            db_crushes = db.session.query(SecretCrush.crusher_id, SecretCrush.crushee_id).all()
+            for crusher_db_id, crushee_db_id in db_crushes:
                 # Get telegram IDs
-                crusher = db.session.query(User).filter_by(id=crush.crusher_id).first()
-                crushee = db.session.query(User).filter_by(id=crush.crushee_id).first()
+                crusher_id = telegram_ids.get(crusher_db_id)
+                crushee_id = telegram_ids.get(crushee_db_id)
                 
-                if crusher and crushee:
+                if crusher_id and crushee_id:
                     # Add to secret crushes
-                    if crusher.telegram_id not in secret_crushes:
-                        secret_crushes[crusher.telegram_id] = set()
+                    if crusher_id not in secret_crushes:
+                        secret_crushes[crusher_id] = set()
                     
-                    secret_crushes[crusher.telegram_id].add(crushee.telegram_id)
+                    secret_crushes[crusher_id].add(crushee_id)
             
             # Load blocks
-            db_blocks = db.session.query(Block).all()
-            for block in db_blocks:
+            db_blocks = db.session.query(Block.blocker_id, Block.blocked_id).all()
+            for blocker_db_id, blocked_db_id in db_blocks:
                 # Get telegram IDs
-                blocker = db.session.query(User).filter_by(id=block.blocker_id).first()
-                blocked = db.session.query(User).filter_by(id=block.blocked_id).first()
+                blocker_id = telegram_ids.get(blocker_db_id)
+                blocked_id = telegram_ids.get(blocked_db_id)
                 
-                if blocker and blocked:
+                if blocker_id and blocked_id:
                     # Add to blocks
-                    if blocker.telegram_id not in blocks:
-                        blocks[blocker.telegram_id] = set()
+                    if blocker_id not in blocks:
+                        blocks[blocker_id] = set()
                     
-                    blocks[blocker.telegram_id].add(blocked.telegram_id)
+                    blocks[blocker_id].add(blocked_id)
         
         logger.info(f"Loaded data from database: {len(user_profiles)} users, "
                   f"{sum(len(v) for v in matches.values()) // 2} matches, "
@@ -128,7 +138,7 @@ def load_data_from_db():
 def get_user_profile(user_id: int) -> Optional[Dict[str, Any]]:
     """Get a user's profile from storage."""
     profile = user_profiles.get(user_id)
-    if profile is None:
+    if profile is None and user_id not in missing_profiles:
         # Try to load directly from database if not in memory
         try:
             from app import db, app
@@ -138,43 +148,139 @@ def get_user_profile(user_id: int) -> Optional[Dict[str, Any]]:
                 db_user = db.session.query(User).filter_by(telegram_id=user_id).first()
                 if db_user:
                     logger.info(f"Found user {user_id} in database that wasn't in memory, loading now")
-                    profile = {
-                        "name": db_user.name,
-                        "age": db_user.age,
-                        "gender": db_user.gender,
-                        "university": db_user.university,
-                        "bio": db_user.bio or "",
-                        "hobbies": db_user.hobbies or "",
-                        "relationship_preference": db_user.relationship_preference or "",
-                        "profile_pic_url": db_user.profile_pic_url or "",
-                        "profile_pic": db_user.profile_pic or "",
-                        "profile_complete": True,  # If in DB, it's complete
-                        "target_universities": [],
-                        "username": ""  # Initialize username field
-                    }
-                    
-                    # Get target universities
-                    for target_uni in db_user.target_universities:
-                        profile["target_universities"].append(target_uni.university_name)
+                    profile = _profile_from_db_user(db_user)
                     
                     # Save to in-memory cache
                     user_profiles[user_id] = profile
+                else:
+                    # Remember the miss so unregistered users don't hit the database on every update
+                    missing_profiles.add(user_id)
         except Exception as e:
             logger.error(f"Error loading user profile from database: {e}", exc_info=True)
     
     return profile
 
 
-def save_user_profile(user_id: int, profile_data: Dict[str, Any]) -> None:
-    """Save a user's profile to storage (both in-memory and database)."""
-    # Save to in-memory storage first
+async def get_user_profile_async(user_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Get a user's profile without blocking the event loop.
+    
+    Profiles in memory (and known misses) are returned directly; only a
+    database lookup is handed off to a worker thread.
+    """
+    profile = user_profiles.get(user_id)
+    if profile is not None or user_id in missing_profiles:
+        return profile
+    return await asyncio.to_thread(get_user_profile, user_id)
+
+
+def get_user_profiles_bulk(user_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    """
+    Get several users' profiles at once.
+    
+    Profiles already in memory are returned directly; the rest are loaded
+    from the database with a single IN query instead of one query per user.
+    """
+    profiles = {user_id: user_profiles[user_id] for user_id in user_ids if user_id in user_profiles}
+    to_load = [user_id for user_id in user_ids if user_id not in profiles and user_id not in missing_profiles]
+    
+    if to_load:
+        try:
+            # Import here to avoid circular imports
+            from app import db, app
+            from models import User
+            
+            with app.app_context():
+                db_users = db.session.query(User).filter(User.telegram_id.in_(to_load)).all()
+                for db_user in db_users:
+                    profile = _profile_from_db_user(db_user)
+                    user_profiles[db_user.telegram_id] = profile
+                    profiles[db_user.telegram_id] = profile
+            
+            missing_profiles.update(user_id for user_id in to_load if user_id not in profiles)
+        except Exception as e:
+            logger.error(f"Error bulk loading user profiles from database: {e}", exc_info=True)
+    
+    return profiles
+
+
+async def get_user_profiles_bulk_async(user_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    """Get several users' profiles, loading any misses in one query off the event loop."""
+    if all(user_id in user_profiles or user_id in missing_profiles for user_id in user_ids):
+        return get_user_profiles_bulk(user_ids)
+    return await asyncio.to_thread(get_user_profiles_bulk, user_ids)
+
+
+def get_registered_user_ids(exclude_id: Optional[int] = None) -> List[int]:
+    """Get the Telegram IDs of all registered users, in registration order."""
+    try:
+        # Import here to avoid circular imports
+        from app import db, app
+        from models import User
+        
+        with app.app_context():
+            query = db.session.query(User.telegram_id)
+            if exclude_id is not None:
+                query = query.filter(User.telegram_id != exclude_id)
+            return [row.telegram_id for row in query.order_by(User.id).all()]
+    except Exception as e:
+        logger.error(f"Error retrieving registered users from database: {e}", exc_info=True)
+    
+    return []
+
+
+def get_users_version() -> int:
+    """Get a counter that changes whenever a new user is registered."""
+    return users_version
+
+
+def remember_user_profile(user_id: int, profile_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Store a user's profile in memory and return a snapshot for the database write.
+    
+    Run this on the event loop; the snapshot (with its lists copied) can then be
+    handed to save_user_profile_to_db in a worker thread while the live profile
+    keeps changing.
+    """
+    # Drop any cached rendering of the old profile
+    profile_data.pop("_formatted", None)
+    profile_data["telegram_id"] = user_id
     user_profiles[user_id] = profile_data
-    logger.info(f"Saving profile for user {user_id} to in-memory storage: {profile_data}")
+    missing_profiles.discard(user_id)
+    # Keep the raw photo bytes out of the log line
+    loggable = {k: v for k, v in profile_data.items() if k != "profile_pic"}
+    logger.info(f"Saving profile for user {user_id} to in-memory storage: {loggable}")
+    
+    return {k: list(v) if isinstance(v, list) else v for k, v in profile_data.items()}
+
+
+def forget_saved_profile_pic(user_id: int, photo: Optional[bytes]) -> None:
+    """
+    Drop photo bytes from memory once save_user_profile_to_db has stored them.
+    
+    The live profile keeps its bytes if a newer photo replaced them meanwhile.
+    """
+    if photo is None:
+        return
+    profile_pic_cache.pop(user_id, None)
+    profile = user_profiles.get(user_id)
+    if profile is not None and profile.get("profile_pic") is photo:
+        del profile["profile_pic"]
+
+
+def save_user_profile_to_db(user_id: int, profile_data: Dict[str, Any]) -> bool:
+    """
+    Write a profile snapshot from remember_user_profile to the database.
+    
+    Returns:
+        True if the profile was committed
+    """
+    global users_version
     
     # Only skip database save if there's no meaningful data yet
     if not profile_data:
         logger.info(f"Skipping database save for user {user_id} - empty profile data")
-        return
+        return False
     
     try:
         # Import here to avoid circular imports
@@ -194,6 +300,7 @@ def save_user_profile(user_id: int, profile_data: Dict[str, Any]) -> None:
                 logger.info(f"Creating new user for {user_id} in database")
                 db_user = User(
                     telegram_id=user_id,
+                    username=profile_data.get("username") or None,
                     name=profile_data.get("name", ""),
                     age=profile_data.get("age", 18),
                     gender=profile_data.get("gender", ""),
@@ -202,10 +309,12 @@ def save_user_profile(user_id: int, profile_data: Dict[str, Any]) -> None:
                     hobbies=profile_data.get("hobbies", ""),
                     relationship_preference=profile_data.get("relationship_preference", ""),
                     profile_pic_url=profile_data.get("profile_pic_url", ""),
-                    profile_pic=profile_data.get("profile_pic", "")
+                    profile_pic=profile_data.get("profile_pic") or None,
+                    profile_pic_file_id=profile_data.get("profile_pic_file_id") or None
                 )
                 db.session.add(db_user)
                 db.session.flush()  # Flush to get the user ID
+                users_version += 1
                 logger.info(f"User {user_id} added to session with DB id {db_user.id}")
                 
                 # Add target universities if they exist
@@ -222,6 +331,7 @@ def save_user_profile(user_id: int, profile_data: Dict[str, Any]) -> None:
             elif db_user:
                 # Update existing user
                 logger.info(f"Updating existing user {user_id} in database")
+                db_user.username = profile_data.get("username") or db_user.username
                 db_user.name = profile_data.get("name", db_user.name)
                 db_user.age = profile_data.get("age", db_user.age)
                 db_user.gender = profile_data.get("gender", db_user.gender)
@@ -233,7 +343,8 @@ def save_user_profile(user_id: int, profile_data: Dict[str, Any]) -> None:
                 
                 # Update profile picture if provided
                 if "profile_pic" in profile_data:
-                    db_user.profile_pic = profile_data["profile_pic"]
+                    db_user.profile_pic = profile_data["profile_pic"] or None
+                    db_user.profile_pic_file_id = profile_data.get("profile_pic_file_id") or None
                 
                 # Update target universities if they exist in the profile data
                 if "target_universities" in profile_data:
@@ -257,8 +368,65 @@ def save_user_profile(user_id: int, profile_data: Dict[str, Any]) -> None:
             
     except Exception as e:
         logger.error(f"Error saving user profile to database: {e}", exc_info=True)
+        return False
     
     logger.info(f"Completed profile save for user {user_id}")
+    return True
+
+
+def get_profile_pic(user_id: int) -> Optional[bytes]:
+    """Load a user's profile picture bytes, from the LRU cache or the database."""
+    if user_id in profile_pic_cache:
+        profile_pic_cache.move_to_end(user_id)
+        return profile_pic_cache[user_id]
+    
+    try:
+        # Import here to avoid circular imports
+        from app import db, app
+        from models import User
+        
+        with app.app_context():
+            row = db.session.query(User.profile_pic).filter_by(telegram_id=user_id).first()
+            photo = row.profile_pic if row else None
+    except Exception as e:
+        logger.error(f"Error loading profile picture from database: {e}", exc_info=True)
+        return None
+    
+    # Remember the result (including "no photo"), evicting the least recently used entry
+    profile_pic_cache[user_id] = photo
+    if len(profile_pic_cache) > PROFILE_PIC_CACHE_SIZE:
+        profile_pic_cache.popitem(last=False)
+    return photo
+
+
+def save_profile_pic_file_id(user_id: int, file_id: str) -> None:
+    """Store the Telegram file_id of a user's already uploaded profile picture."""
+    try:
+        # Import here to avoid circular imports
+        from app import db, app
+        from models import User
+        
+        with app.app_context():
+            db.session.query(User).filter_by(telegram_id=user_id).update({"profile_pic_file_id": file_id})
+            db.session.commit()
+    except Exception as e:
+        logger.error(f"Error saving profile picture file_id to database: {e}", exc_info=True)
+
+
+def find_user_id_by_username(username: str) -> Optional[int]:
+    """Find a registered user's Telegram ID by their Telegram username."""
+    try:
+        # Import here to avoid circular imports
+        from app import db, app
+        from models import User
+        
+        with app.app_context():
+            row = db.session.query(User.telegram_id).filter_by(username=username).first()
+            return row.telegram_id if row else None
+    except Exception as e:
+        logger.error(f"Error looking up user by username: {e}", exc_info=True)
+    
+    return None
 
 
 def get_university_list() -> List[str]:
@@ -324,34 +492,54 @@ def get_potential_matches(user_id: int) -> List[int]:
     logger.info(f"Finding potential matches for user {user_id}")
     potential_matches = []
     
+    # Resolve the filters once instead of per candidate
+    wanted_gender = {"male": "female", "female": "male"}.get(user_gender)
+    match_all_universities = "All" in target_universities
+    target_set = set(target_universities)
+    excluded_users.add(user_id)
+    
     for other_id, other_profile in user_profiles.items():
-        # Skip if it's the same user, not a complete profile, or already excluded
-        if (other_id == user_id or 
-            not other_profile.get("profile_complete") or
-            other_id in excluded_users):
+        # Skip if it's the same user, already excluded, or not a complete profile
+        if other_id in excluded_users or not other_profile.get("profile_complete"):
             continue
         
         # Only match opposite gender
-        other_gender = other_profile.get("gender")
-        if (user_gender == "male" and other_gender != "female") or (user_gender == "female" and other_gender != "male"):
+        if wanted_gender is not None and other_profile.get("gender") != wanted_gender:
             continue
         
-        # Check university preferences
-        other_university = other_profile.get("university")
-        
         # Only include this user if their university is in the target list
         # or if "All" is selected
-        if "All" in target_universities or other_university in target_universities:
+        if match_all_universities or other_profile.get("university") in target_set:
             potential_matches.append(other_id)
-            logger.info(f"Found potential match: {other_id} ({other_profile.get('name')}) for user {user_id}")
+            logger.debug(f"Found potential match: {other_id} ({other_profile.get('name')}) for user {user_id}")
     
     # Randomize order
     random.shuffle(potential_matches)
     logger.info(f"Found {len(potential_matches)} potential matches for user {user_id}")
-    
+
     return potential_matches
 
 
+def is_potential_match(user_id: int, other_id: int) -> bool:
+    """
+    Check that a queued candidate can still be shown to a user.
+
+    Candidates are queued ahead of time, so by the time one is shown the
+    two users may have liked, matched or blocked each other, or the
+    candidate's profile may have become incomplete.
+    """
+    if other_id == user_id:
+        return False
+    other_profile = user_profiles.get(other_id)
+    if not other_profile or not other_profile.get("profile_complete"):
+        return False
+    if other_id in likes.get(user_id, ()) or other_id in matches.get(user_id, ()):
+        return False
+    if other_id in blocks.get(user_id, ()) or user_id in blocks.get(other_id, ()):
+        return False
+    return True
+
+
 def process_match_decision(user_id: int, other_id: int, is_like: bool) -> str:
     """
     Process a user's decision to like or pass on another user.
@@ -446,7 +634,7 @@ def process_match_decision(user_id: int, other_id: int, is_like: bool) -> str:
 
 
 def add_secret_crush(user_id: int, crush_id: int = None, crush_name: str = None,
-                  social_media_account: str = None, crush_photo: str = None) -> str:
+                  social_media_account: str = None, crush_photo: bytes = None) -> str:
     """
     Add a secret crush.
     
@@ -455,7 +643,7 @@ def add_secret_crush(user_id: int, crush_id: int = None, crush_name: str = None,
         crush_id: The telegram ID of the crush (if they're a registered user), can be None for external crushes
         crush_name: The name of the crush (required for external crushes)
         social_media_account: The social media account of the crush (optional for external crushes)
-        crush_photo: The photo of the crush in hex-encoded format (optional for external crushes)
+        crush_photo: The photo of the crush as raw bytes (optional for external crushes)
     
     Returns:
         - "added" if the crush was added
@@ -561,55 +749,6 @@ def add_secret_crush(user_id: int, crush_id: int = None, crush_name: str = None,
         return "added_external"
 
 
-def get_secret_crushes(user_id: int) -> Tuple[List[int], List[Dict[str, Any]]]:
-    """
-    Get a user's secret crushes.
-    
-    Returns:
-        Tuple containing:
-        - List of Telegram IDs for registered user crushes
-        - List of dictionaries with details for external crushes
-          Each dict contains: 'id', 'name', 'social_media', 'photo'
-    """
-    registered_crushes = list(secret_crushes.get(user_id, set()))
-    external_crushes = []
-    
-    try:
-        # Import here to avoid circular imports
-        from app import db, app
-        from models import SecretCrush, User
-        
-        # Use Flask application context
-        with app.app_context():
-            user = db.session.query(User).filter_by(telegram_id=user_id).first()
-            
-            if user:
-                # Get crushes from database
-                db_crushes = db.session.query(SecretCrush).filter_by(crusher_id=user.id).all()
-                
-                # Process each crush
-                for crush in db_crushes:
-                    if crush.crushee_id is not None:
-                        # This is a registered user crush
-                        crushee = db.session.query(User).filter_by(id=crush.crushee_id).first()
-                        if crushee and crushee.telegram_id not in registered_crushes:
-                            registered_crushes.append(crushee.telegram_id)
-                    else:
-                        # This is an external crush
-                        external_crushes.append({
-                            'id': crush.id,  # Database ID for the crush entry
-                            'name': crush.crush_name,
-                            'social_media': crush.social_media_account,
-                            'photo': crush.crush_photo
-                        })
-            
-            # No need to commit as we're just reading
-    except Exception as e:
-        logger.error(f"Error retrieving secret crushes from database: {e}", exc_info=True)
-    
-    return registered_crushes, external_crushes
-
-
 def check_mutual_crush(user_id: int, crush_id: int) -> bool:
     """Check if two users have a mutual crush."""
     # Check in-memory
@@ -660,7 +799,6 @@ def get_chat_history(user1_id: int, user2_id: int) -> List[Dict[str, Any]]:
         # Import here to avoid circular imports
         from app import db, app
         from models import Message, User
-        from datetime import datetime
         
         # Use Flask application context
         with app.app_context():
@@ -702,20 +840,30 @@ def get_chat_history(user1_id: int, user2_id: int) -> List[Dict[str, Any]]:
     return in_memory_chats
 
 
-def add_chat_message(sender_id: int, recipient_id: int, text: str) -> None:
-    """Add a chat message between two users."""
+def add_chat_message_to_memory(sender_id: int, recipient_id: int, text: str) -> Dict[str, Any]:
+    """Add a chat message to the in-memory chat history and return it."""
     # Sort IDs to ensure consistent key for in-memory storage
     chat_key = tuple(sorted([sender_id, recipient_id]))
     
     if chat_key not in chats:
         chats[chat_key] = []
     
-    # Add to in-memory storage
-    chats[chat_key].append({
+    message = {
         "sender_id": sender_id,
+        "recipient_id": recipient_id,
         "timestamp": time.time(),
         "text": text
-    })
+    }
+    chats[chat_key].append(message)
+    
+    logger.info(f"Message added to in-memory chat between {sender_id} and {recipient_id}")
+    return message
+
+
+def save_chat_messages_to_db(messages: List[Dict[str, Any]]) -> None:
+    """Persist a batch of in-memory chat messages with a single insert."""
+    if not messages:
+        return
     
     try:
         # Import here to avoid circular imports
@@ -724,26 +872,33 @@ def add_chat_message(sender_id: int, recipient_id: int, text: str) -> None:
         
         # Use Flask application context
         with app.app_context():
-            # Get user IDs from database
-            sender = db.session.query(User).filter_by(telegram_id=sender_id).first()
-            receiver = db.session.query(User).filter_by(telegram_id=recipient_id).first()
+            # Resolve every participant's database ID in one query
+            telegram_ids = {m["sender_id"] for m in messages} | {m["recipient_id"] for m in messages}
+            id_map = dict(
+                db.session.query(User.telegram_id, User.id)
+                .filter(User.telegram_id.in_(telegram_ids))
+                .all()
+            )
             
-            if sender and receiver:
-                # Create message
-                message = Message(
-                    sender_id=sender.id,
-                    receiver_id=receiver.id,
-                    text=text,
-                    is_read=False
-                )
-                db.session.add(message)
+            rows = [
+                {
+                    "sender_id": id_map[m["sender_id"]],
+                    "receiver_id": id_map[m["recipient_id"]],
+                    "text": m["text"],
+                    "created_at": datetime.utcfromtimestamp(m["timestamp"]),
+                    "is_read": False
+                }
+                for m in messages
+                if m["sender_id"] in id_map and m["recipient_id"] in id_map
+            ]
+            
+            if rows:
+                db.session.bulk_insert_mappings(Message, rows)
                 db.session.commit()
         
-        logger.info(f"Message added to database between {sender_id} and {recipient_id}")
+        logger.info(f"Saved {len(rows)} chat messages to database")
     except Exception as e:
-        logger.error(f"Error saving chat message to database: {e}", exc_info=True)
-    
-    logger.info(f"Message added to in-memory chat between {sender_id} and {recipient_id}")
+        logger.error(f"Error saving chat messages to database: {e}", exc_info=True)
 
 
 def block_user_from_db(user_id: int, blocked_id: int) -> None:
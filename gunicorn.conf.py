@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Gunicorn settings for serving wsgi.py
+"""
+
+import os
+
+# Tell wsgi.py not to start the bot on import; post_fork starts it in the worker
+os.environ["BOT_STARTED_BY_GUNICORN"] = "1"
+
+
+def post_fork(server, worker):
+    """Start the Telegram bot in the worker, provided it is the only one."""
+    if server.cfg.workers > 1:
+        # Each worker would run its own bot with its own in-memory state and
+        # the webhook's updates would be split between them
+        server.log.error(
+            f"Not starting the Telegram bot: {server.cfg.workers} workers are configured. "
+            "Run a single worker (use --threads for concurrency) to serve the webhook."
+        )
+        return
+
+    from wsgi import start_bot_once
+    start_bot_once()
@@ -5,23 +5,30 @@
 Handlers for bot commands and conversations
 """
 
+import asyncio
 import logging
-import re
+import time
+from dataclasses import dataclass
+from functools import lru_cache
 from io import BytesIO
+from typing import Any, Dict, List, Optional, Tuple
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InlineQueryResultArticle, InputTextMessageContent
 from telegram.ext import ContextTypes, ConversationHandler
 from data_store import (
-    get_user_profile, save_user_profile, get_matches, save_match, 
-    get_potential_matches, process_match_decision, get_secret_crushes,
-    add_secret_crush, check_mutual_crush, get_chat_history, add_chat_message,
-    block_user_from_db, report_user_to_db, unmatch_user_from_db, get_university_list
+    get_user_profile, remember_user_profile, save_user_profile_to_db, forget_saved_profile_pic, get_matches,
+    get_potential_matches, is_potential_match, process_match_decision,
+    add_secret_crush, check_mutual_crush, get_chat_history,
+    block_user_from_db, report_user_to_db, unmatch_user_from_db, get_university_list,
+    find_user_id_by_username, get_registered_user_ids, get_user_profiles_bulk, get_users_version
 )
 from utils import (
     is_valid_age, format_profile, check_if_registered, 
     send_profile_with_photo, send_mutual_crush_notification,
-    get_profile_picture
+    get_profile_photo, remember_photo_file_id, CustomUpdate
 )
-from constants import UNIVERSITY_LIST, RELATIONSHIP_TYPES
+from constants import RELATIONSHIP_TYPES
+from chat_writer import chat_writer
+from outbox import outbox
 
 # Enable logging
 logging.basicConfig(
@@ -34,64 +41,294 @@ logger = logging.getLogger(__name__)
 # Define conversation states
 NAME, AGE, GENDER, PROFILE_PIC, UNIVERSITY, TARGET_UNIVERSITIES, HOBBIES, BIO, RELATIONSHIP_PREFERENCE, COMPLETED = range(10)
 
+# Static command texts, built once at import time
+_START_TEMPLATE = (
+    "Hi {mention}! 👋\n\n"
+    "Welcome to Ethiopian University Dating Bot! 💘\n\n"
+    "Find your perfect match among university students across Ethiopia.\n\n"
+    "To get started, use /register to create your profile.\n"
+    "Use /match to find and connect with potential matches.\n"
+    "Use /matches to chat with your mutual matches.\n"
+    "Use /cancel_chat to exit a conversation with a match.\n"
+    "Use /secret_crush to add someone special (either a bot user or external crush).\n"
+    "Use /help to see all available commands.\n\n"
+    "Join our channel @gbi_match_maker for updates and announcements!\n\n"
+    "Need assistance at any time? Use /help for a list of commands."
+)
+
+_HELP_TEXT = (
+    "🌟 *Ethiopian University Dating Bot Help* 🌟\n\n"
+    "*Available Commands:*\n"
+    "/start - Start the bot\n"
+    "/register - Create your profile (one-time process)\n"
+    "/edit_profile - Edit your existing profile\n"
+    "/profile - View your profile\n"
+    "/match - Find new potential matches to like or pass\n"
+    "/matches - See your current matches and start chatting\n"
+    "/cancel_chat - Exit the current chat conversation\n"
+    "/secret_crush or /secretcrush - Add a secret crush (bot user or external)\n"
+    "/help - Show this help message\n"
+    "/cancel - Cancel current operation\n\n"
+    
+    "*How it works:*\n"
+    "1. Register your profile with your details\n"
+    "2. Browse potential matches\n"
+    "3. When you both like each other, you'll match!\n"
+    "4. Chat anonymously with your matches\n"
+    "5. Use the Secret Crush feature to let someone know you're interested:\n"
+    "   - Add users already on the bot\n"
+    "   - Add external crushes with their name, social media and photo\n\n"
+    
+    "*Profile Tips:*\n"
+    "• A good profile picture greatly increases your chances of matching\n"
+    "• Your profile picture should clearly show your face\n"
+    "• Profile pictures are mandatory for all users\n"
+    "• Only you and your matches can see your profile picture\n"
+    "• You can only match with opposite-gender users\n"
+    "• Ages must be between 18-30 years\n\n"
+    
+    "*Stay Updated:*\n"
+    "• Join our channel @gbi_match_maker for announcements and tips!\n\n"
+    
+    "Happy dating! 💖"
+)
+
+
+async def _download_photo(photo_file) -> bytes:
+    """Download a Telegram file straight into a buffer and return its bytes."""
+    buffer = BytesIO()
+    await photo_file.download_to_memory(buffer)
+    return buffer.getvalue()
+
+
+def _pair_rows(buttons):
+    """Arrange inline keyboard buttons into rows of two."""
+    return [buttons[i:i + 2] for i in range(0, len(buttons), 2)]
+
+
+# Keyboards that are identical for every user are built once
+_REL_KEYBOARD = InlineKeyboardMarkup(_pair_rows([
+    InlineKeyboardButton(rel, callback_data=f"rel_{i}") for i, rel in enumerate(RELATIONSHIP_TYPES)
+]))
+
+# The university list never changes at runtime, so bind it once
+_UNIVERSITIES = tuple(get_university_list())
+
+# Callback data for the registration university keyboards
+_UNI_CALLBACKS = tuple(f"uni_{i}" for i in range(len(_UNIVERSITIES)))
+_TARGET_CALLBACKS = tuple(f"target_{i}" for i in range(len(_UNIVERSITIES)))
+
+_UNI_KEYBOARD = InlineKeyboardMarkup(_pair_rows([
+    InlineKeyboardButton(uni, callback_data=_UNI_CALLBACKS[i]) for i, uni in enumerate(_UNIVERSITIES)
+]))
+
+_TARGET_KEYBOARD = InlineKeyboardMarkup(
+    [[InlineKeyboardButton("All Universities", callback_data="target_all")]]
+    + _pair_rows([
+        InlineKeyboardButton(uni, callback_data=_TARGET_CALLBACKS[i]) for i, uni in enumerate(_UNIVERSITIES)
+    ])
+    + [[InlineKeyboardButton("Done Selecting", callback_data="target_done")]]
+)
+
+# Keyboards for the /edit_profile callbacks
+_GENDER_KEYBOARD = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("Male", callback_data="gender_male"),
+        InlineKeyboardButton("Female", callback_data="gender_female")
+    ]
+])
+
+_EDIT_TARGET_KEYBOARD = InlineKeyboardMarkup(
+    _pair_rows([
+        InlineKeyboardButton(uni, callback_data=f"target_uni_{i}") for i, uni in enumerate(_UNIVERSITIES)
+    ])
+    + [[InlineKeyboardButton("All Universities", callback_data="target_uni_all")]]
+)
+
+_EDIT_REL_KEYBOARD = InlineKeyboardMarkup(_pair_rows([
+    InlineKeyboardButton(rel, callback_data=f"edit_rel_{i}") for i, rel in enumerate(RELATIONSHIP_TYPES)
+]))
+
+
+@lru_cache(maxsize=1024)
+def _build_match_kb(match_id: int) -> InlineKeyboardMarkup:
+    """Build (and cache) the Pass/Like keyboard shown under a potential match."""
+    return InlineKeyboardMarkup([
+        [
+            InlineKeyboardButton("👎 Pass", callback_data=f"pass_{match_id}"),
+            InlineKeyboardButton("👍 Like", callback_data=f"like_{match_id}")
+        ]
+    ])
+
+# Debounced profile saves: user_id -> (scheduled timer, profile to write)
+SAVE_DEBOUNCE_SECONDS = 0.5
+_pending_saves: Dict[int, Tuple[asyncio.TimerHandle, Dict[str, Any]]] = {}
+# Profile writes currently running in a worker thread: user_id -> latest write
+_inflight_saves: Dict[int, asyncio.Task] = {}
+
+
+async def _write_profile(user_id: int, snapshot: Dict[str, Any], previous: Optional[asyncio.Task]) -> None:
+    """Write a profile snapshot in a worker thread once the user's previous write has finished."""
+    if previous is not None:
+        # Two concurrent writes for one user could duplicate their target university rows
+        await asyncio.wait([previous])
+    try:
+        saved = await asyncio.to_thread(save_user_profile_to_db, user_id, snapshot)
+    except Exception as e:
+        logger.error(f"Error saving profile for user {user_id}: {e}", exc_info=True)
+        return
+    if saved:
+        forget_saved_profile_pic(user_id, snapshot.get("profile_pic"))
+
+
+def _start_save(user_id: int, profile: Dict[str, Any]) -> asyncio.Task:
+    """
+    Save a profile: update memory now and write a snapshot to the database.
+    
+    Any debounced save for the user is superseded, and the write is queued
+    behind any write already running for the user. Await the returned task
+    when the handler needs the write to have finished.
+    """
+    _cancel_pending_save(user_id)
+    snapshot = remember_user_profile(user_id, profile)
+    task = asyncio.create_task(_write_profile(user_id, snapshot, _inflight_saves.get(user_id)))
+    _inflight_saves[user_id] = task
+    
+    def _done(finished: asyncio.Task) -> None:
+        if _inflight_saves.get(user_id) is finished:
+            del _inflight_saves[user_id]
+    
+    task.add_done_callback(_done)
+    return task
+
+
+def _run_pending_save(user_id: int, profile: Dict[str, Any]) -> None:
+    """Write a debounced profile save once its timer fires."""
+    _pending_saves.pop(user_id, None)
+    _start_save(user_id, profile)
+
+
+def _debounced_save(user_id: int, profile: Dict[str, Any]) -> None:
+    """
+    Schedule a profile save, coalescing rapid taps into a single write.
+    
+    Any save already pending for the user is replaced, so at most one
+    database write happens per SAVE_DEBOUNCE_SECONDS window.
+    """
+    _cancel_pending_save(user_id)
+    # The profile has already changed, so don't show its old rendering meanwhile
+    profile.pop("_formatted", None)
+    handle = asyncio.get_running_loop().call_later(
+        SAVE_DEBOUNCE_SECONDS, _run_pending_save, user_id, profile
+    )
+    _pending_saves[user_id] = (handle, profile)
+
+
+def _cancel_pending_save(user_id: int) -> Optional[Dict[str, Any]]:
+    """Cancel a pending debounced save, returning the profile it would have written."""
+    pending = _pending_saves.pop(user_id, None)
+    if pending is None:
+        return None
+    handle, profile = pending
+    handle.cancel()
+    return profile
+
+
+async def _flush_pending_save(user_id: int) -> None:
+    """Write out any pending debounced save for the user and wait for it to finish."""
+    profile = _cancel_pending_save(user_id)
+    if profile is not None:
+        _start_save(user_id, profile)
+    inflight = _inflight_saves.get(user_id)
+    if inflight is not None:
+        await asyncio.shield(inflight)
+
+# Rendered secret crush lists: (user_id, users_version) -> (rendered_at, listed user ids, text)
+CRUSH_LIST_TTL_SECONDS = 60
+CRUSH_LIST_CACHE_SIZE = 1024
+_crush_list_cache: Dict[Tuple[int, int], Tuple[float, List[int], str]] = {}
+
+
+def _get_crush_list(user_id: int) -> Tuple[List[int], str]:
+    """
+    Get the registered users a user can pick as a secret crush.
+    
+    Returns the listed Telegram IDs in display order together with the
+    rendered list text. Results are cached for CRUSH_LIST_TTL_SECONDS and
+    dropped as soon as a new user registers.
+    """
+    key = (user_id, get_users_version())
+    now = time.monotonic()
+    cached = _crush_list_cache.get(key)
+    if cached and now - cached[0] < CRUSH_LIST_TTL_SECONDS:
+        return cached[1], cached[2]
+    
+    user_ids = get_registered_user_ids(exclude_id=user_id)
+    profiles = get_user_profiles_bulk(user_ids)
+    
+    lines = []
+    for idx, other_id in enumerate(user_ids, 1):
+        profile = profiles.get(other_id)
+        if profile:
+            name = profile.get("name", "Anonymous")
+            gender = profile.get("gender", "Unknown")
+            university = profile.get("university", "Unknown University")
+            lines.append(f"{idx}. {name} - {gender} at {university}\n")
+    user_list = "Here are some registered users you might want to add as a crush:\n\n" + "".join(lines) + "\n"
+    
+    if key not in _crush_list_cache and len(_crush_list_cache) >= CRUSH_LIST_CACHE_SIZE:
+        # Evict the oldest entry
+        _crush_list_cache.pop(next(iter(_crush_list_cache)))
+    _crush_list_cache[key] = (now, user_ids, user_list)
+    
+    return user_ids, user_list
+
+
+def _refill_queue(user_id: int, context: ContextTypes.DEFAULT_TYPE, exclude: Optional[int] = None) -> None:
+    """Recompute the cached potential-match queue for a user."""
+    context.user_data["potential_queue"] = [
+        match_id for match_id in get_potential_matches(user_id) if match_id != exclude
+    ]
+
+
+def _pop_potential_match(user_id: int, context: ContextTypes.DEFAULT_TYPE, exclude: Optional[int] = None) -> Optional[int]:
+    """
+    Take the next potential match from the user's cached queue.
+    
+    The queue is filled once per browsing session and refilled when it
+    runs dry, so swipes don't rescan every profile.
+    Queued candidates are re-checked when popped, since likes, matches and
+    blocks may have changed since the queue was built.
+    """
+    queue = context.user_data.get("potential_queue")
+    rebuilt = not queue
+    if rebuilt:
+        queue = get_potential_matches(user_id)
+        context.user_data["potential_queue"] = queue
+    
+    next_match_id = None
+    while queue:
+        candidate = queue.pop(0)
+        if candidate != exclude and is_potential_match(user_id, candidate):
+            next_match_id = candidate
+            break
+    
+    # A queue rebuilt just now is already current, so don't scan again for it
+    if not queue and not rebuilt:
+        _refill_queue(user_id, context, exclude=next_match_id)
+    
+    return next_match_id
+
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a welcome message when the command /start is issued."""
     user = update.effective_user
-    await update.message.reply_html(
-        f"Hi {user.mention_html()}! 👋\n\n"
-        f"Welcome to Ethiopian University Dating Bot! 💘\n\n"
-        f"Find your perfect match among university students across Ethiopia.\n\n"
-        f"To get started, use /register to create your profile.\n"
-        f"Use /match to find and connect with potential matches.\n"
-        f"Use /matches to chat with your mutual matches.\n"
-        f"Use /cancel_chat to exit a conversation with a match.\n"
-        f"Use /secret_crush to add someone special (either a bot user or external crush).\n"
-        f"Use /help to see all available commands.\n\n"
-        f"Join our channel @gbi_match_maker for updates and announcements!\n\n"
-        f"Need assistance at any time? Use /help for a list of commands."
-    )
+    await update.message.reply_html(_START_TEMPLATE.format(mention=user.mention_html()))
 
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a message when the command /help is issued."""
-    help_text = (
-        "🌟 *Ethiopian University Dating Bot Help* 🌟\n\n"
-        "*Available Commands:*\n"
-        "/start - Start the bot\n"
-        "/register - Create your profile (one-time process)\n"
-        "/edit_profile - Edit your existing profile\n"
-        "/profile - View your profile\n"
-        "/match - Find new potential matches to like or pass\n"
-        "/matches - See your current matches and start chatting\n"
-        "/cancel_chat - Exit the current chat conversation\n"
-        "/secret_crush or /secretcrush - Add a secret crush (bot user or external)\n"
-        "/help - Show this help message\n"
-        "/cancel - Cancel current operation\n\n"
-        
-        "*How it works:*\n"
-        "1. Register your profile with your details\n"
-        "2. Browse potential matches\n"
-        "3. When you both like each other, you'll match!\n"
-        "4. Chat anonymously with your matches\n"
-        "5. Use the Secret Crush feature to let someone know you're interested:\n"
-        "   - Add users already on the bot\n"
-        "   - Add external crushes with their name, social media and photo\n\n"
-        
-        "*Profile Tips:*\n"
-        "• A good profile picture greatly increases your chances of matching\n"
-        "• Your profile picture should clearly show your face\n"
-        "• Profile pictures are mandatory for all users\n"
-        "• Only you and your matches can see your profile picture\n"
-        "• You can only match with opposite-gender users\n"
-        "• Ages must be between 18-30 years\n\n"
-        
-        "*Stay Updated:*\n"
-        "• Join our channel @gbi_match_maker for announcements and tips!\n\n"
-        
-        "Happy dating! 💖"
-    )
-    await update.message.reply_markdown(help_text)
+    await update.message.reply_markdown(_HELP_TEXT)
 
 
 async def register_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -119,7 +356,7 @@ async def register_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -
             logger.info(f"Updated username for {user_id} to {user.username}")
     
     # Save user profile immediately to ensure they exist in the database
-    save_user_profile(user_id, user_profile)
+    await _start_save(user_id, user_profile)
     logger.info(f"Saved initial profile for {user_id}")
     
     if user_profile and user_profile.get("profile_complete"):
@@ -171,7 +408,7 @@ async def handle_name(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
     
     # Create the user in the database immediately
     # We're setting partial=True to indicate this is a partial profile being saved
-    save_user_profile(user_id, user_profile)
+    await _start_save(user_id, user_profile)
     
     await update.message.reply_text(
         f"Nice to meet you, {name}! 👋\n"
@@ -197,20 +434,11 @@ async def handle_age(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     # Save the age to user data
     user_profile = get_user_profile(user_id)
     user_profile["age"] = age
-    save_user_profile(user_id, user_profile)
-    
-    # Create gender selection keyboard
-    keyboard = [
-        [
-            InlineKeyboardButton("Male", callback_data="gender_male"),
-            InlineKeyboardButton("Female", callback_data="gender_female"),
-        ]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    await _start_save(user_id, user_profile)
     
     await update.message.reply_text(
         "What's your gender?",
-        reply_markup=reply_markup
+        reply_markup=_GENDER_KEYBOARD
     )
     
     return GENDER
@@ -227,7 +455,7 @@ async def handle_gender(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
     # Save the gender to user data
     user_profile = get_user_profile(user_id)
     user_profile["gender"] = gender
-    save_user_profile(user_id, user_profile)
+    await _start_save(user_id, user_profile)
     
     await query.edit_message_text(
         f"Gender: {gender.capitalize()}\n\n"
@@ -245,30 +473,21 @@ async def handle_profile_pic(update: Update, context: ContextTypes.DEFAULT_TYPE)
     photo_file = await update.message.photo[-1].get_file()
     
     # Download the photo as bytes
-    photo_bytes = await photo_file.download_as_bytearray()
+    photo_bytes = await _download_photo(photo_file)
     
-    # Save the profile picture to user data (as bytes)
+    # Save the profile picture to user data (as raw bytes)
     user_profile = get_user_profile(user_id)
-    user_profile["profile_pic"] = photo_bytes.hex()  # Convert to hex string for storage
-    save_user_profile(user_id, user_profile)
-    
-    # Create university selection keyboard
-    keyboard = []
-    university_list = get_university_list()
-    
-    # Create buttons in rows of 2
-    for i in range(0, len(university_list), 2):
-        row = []
-        row.append(InlineKeyboardButton(university_list[i], callback_data=f"uni_{i}"))
-        if i + 1 < len(university_list):
-            row.append(InlineKeyboardButton(university_list[i+1], callback_data=f"uni_{i+1}"))
-        keyboard.append(row)
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await update.message.reply_text(
-        "Great! Now, select your university:",
-        reply_markup=reply_markup
+    user_profile["profile_pic"] = photo_bytes
+    # Telegram can re-send the photo by file_id, so keep it to avoid re-uploading
+    user_profile["profile_pic_file_id"] = update.message.photo[-1].file_id
+    
+    # Save in a worker thread while the next step is sent
+    await asyncio.gather(
+        _start_save(user_id, user_profile),
+        update.message.reply_text(
+            "Great! Now, select your university:",
+            reply_markup=_UNI_KEYBOARD
+        )
     )
     
     return UNIVERSITY
@@ -281,41 +500,21 @@ async def handle_university(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     user_id = update.effective_user.id
     university_idx = int(query.data.split("_")[1])
-    university_list = get_university_list()
-    university = university_list[university_idx]
+    university = _UNIVERSITIES[university_idx]
     
     # Save the university to user data
     user_profile = get_user_profile(user_id)
     user_profile["university"] = university
-    save_user_profile(user_id, user_profile)
-    
-    # Create target universities selection keyboard
-    keyboard = []
-    
-    # Add "All Universities" option
-    keyboard.append([InlineKeyboardButton("All Universities", callback_data="target_all")])
-    
-    # Create buttons in rows of 2 for specific universities
-    for i in range(0, len(university_list), 2):
-        row = []
-        row.append(InlineKeyboardButton(university_list[i], callback_data=f"target_{i}"))
-        if i + 1 < len(university_list):
-            row.append(InlineKeyboardButton(university_list[i+1], callback_data=f"target_{i+1}"))
-        keyboard.append(row)
-    
-    # Add Done button
-    keyboard.append([InlineKeyboardButton("Done Selecting", callback_data="target_done")])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
     
     # Initialize target_universities as an empty list
     user_profile["target_universities"] = []
-    save_user_profile(user_id, user_profile)
+    await _start_save(user_id, user_profile)
+    context.user_data["_last_target_snapshot"] = frozenset()
     
     await query.edit_message_text(
         f"Your university: {university}\n\n"
         f"Now, select universities you want to date from (you can select multiple):",
-        reply_markup=reply_markup
+        reply_markup=_TARGET_KEYBOARD
     )
     
     return TARGET_UNIVERSITIES
@@ -324,15 +523,15 @@ async def handle_university(update: Update, context: ContextTypes.DEFAULT_TYPE)
 async def handle_target_universities(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Handle the user's target universities selection."""
     query = update.callback_query
-    await query.answer()
     
     user_id = update.effective_user.id
     user_profile = get_user_profile(user_id)
     
     if query.data == "target_all":
         # User selected all universities
+        await query.answer()
         user_profile["target_universities"] = ["All"]
-        save_user_profile(user_id, user_profile)
+        await _start_save(user_id, user_profile)
         
         await query.edit_message_text(
             "You've selected all universities.\n\n"
@@ -347,6 +546,8 @@ async def handle_target_universities(update: Update, context: ContextTypes.DEFAU
             await query.answer("Please select at least one university")
             return TARGET_UNIVERSITIES
         
+        await query.answer()
+        await _flush_pending_save(user_id)
         await query.edit_message_text(
             "Universities selected!\n\n"
             "What are your hobbies and interests? (separate with commas)"
@@ -356,36 +557,44 @@ async def handle_target_universities(update: Update, context: ContextTypes.DEFAU
     else:
         # User selected a specific university
         university_idx = int(query.data.split("_")[1])
-        university_list = get_university_list()
-        selected_university = university_list[university_idx]
+        selected_university = _UNIVERSITIES[university_idx]
         
         # Add to the list if not already there
-        if "target_universities" not in user_profile:
-            user_profile["target_universities"] = []
-            
-        if "All" in user_profile["target_universities"]:
+        target_unis = user_profile.get("target_universities") or []
+        if "All" in target_unis:
             # If "All" was previously selected, clear it
-            user_profile["target_universities"] = []
-            
-        if selected_university not in user_profile["target_universities"]:
-            user_profile["target_universities"].append(selected_university)
+            target_unis = []
+        
+        selected = set(target_unis)
+        if selected_university not in selected:
+            target_unis.append(selected_university)
+            selected.add(selected_university)
+        user_profile["target_universities"] = target_unis
+        
+        # Skip the Telegram edit entirely when the selection didn't change
+        snapshot = frozenset(selected)
+        if snapshot == context.user_data.get("_last_target_snapshot"):
+            await query.answer("Already selected")
+            return TARGET_UNIVERSITIES
         
-        save_user_profile(user_id, user_profile)
+        await query.answer()
+        context.user_data["_last_target_snapshot"] = snapshot
+        _debounced_save(user_id, user_profile)
         
         # Recreate the keyboard with selected universities marked
         keyboard = []
         keyboard.append([InlineKeyboardButton("All Universities", callback_data="target_all")])
         
-        for i in range(0, len(university_list), 2):
+        for i in range(0, len(_UNIVERSITIES), 2):
             row = []
-            uni1 = university_list[i]
-            selected1 = "✅ " if uni1 in user_profile["target_universities"] else ""
-            row.append(InlineKeyboardButton(f"{selected1}{uni1}", callback_data=f"target_{i}"))
+            uni1 = _UNIVERSITIES[i]
+            selected1 = "✅ " if uni1 in selected else ""
+            row.append(InlineKeyboardButton(f"{selected1}{uni1}", callback_data=_TARGET_CALLBACKS[i]))
             
-            if i + 1 < len(university_list):
-                uni2 = university_list[i+1]
-                selected2 = "✅ " if uni2 in user_profile["target_universities"] else ""
-                row.append(InlineKeyboardButton(f"{selected2}{uni2}", callback_data=f"target_{i+1}"))
+            if i + 1 < len(_UNIVERSITIES):
+                uni2 = _UNIVERSITIES[i+1]
+                selected2 = "✅ " if uni2 in selected else ""
+                row.append(InlineKeyboardButton(f"{selected2}{uni2}", callback_data=_TARGET_CALLBACKS[i+1]))
             
             keyboard.append(row)
         
@@ -393,7 +602,7 @@ async def handle_target_universities(update: Update, context: ContextTypes.DEFAU
         
         reply_markup = InlineKeyboardMarkup(keyboard)
         
-        selected_text = ", ".join(user_profile["target_universities"])
+        selected_text = ", ".join(target_unis)
         await query.edit_message_text(
             f"Your university: {user_profile['university']}\n\n"
             f"Selected universities: {selected_text}\n\n"
@@ -418,7 +627,7 @@ async def handle_hobbies(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     # Save the hobbies to user data
     user_profile = get_user_profile(user_id)
     user_profile["hobbies"] = hobbies_text
-    save_user_profile(user_id, user_profile)
+    await _start_save(user_id, user_profile)
     
     await update.message.reply_text(
         f"Great! Now, write a short bio about yourself (max 500 characters):"
@@ -441,22 +650,11 @@ async def handle_bio(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     # Save the bio to user data
     user_profile = get_user_profile(user_id)
     user_profile["bio"] = bio_text
-    save_user_profile(user_id, user_profile)
-    
-    # Create relationship preference keyboard
-    keyboard = []
-    for i in range(0, len(RELATIONSHIP_TYPES), 2):
-        row = []
-        row.append(InlineKeyboardButton(RELATIONSHIP_TYPES[i], callback_data=f"rel_{i}"))
-        if i + 1 < len(RELATIONSHIP_TYPES):
-            row.append(InlineKeyboardButton(RELATIONSHIP_TYPES[i+1], callback_data=f"rel_{i+1}"))
-        keyboard.append(row)
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    await _start_save(user_id, user_profile)
     
     await update.message.reply_text(
         "Finally, what type of relationship are you looking for?",
-        reply_markup=reply_markup
+        reply_markup=_REL_KEYBOARD
     )
     
     # Add a safety measure to make sure we're registered for the next callback
@@ -480,7 +678,7 @@ async def handle_relationship_preference(update: Update, context: ContextTypes.D
     
     # Mark profile as complete
     user_profile["profile_complete"] = True
-    save_user_profile(user_id, user_profile)
+    await _start_save(user_id, user_profile)
     
     # Create profile review keyboard
     keyboard = [
@@ -555,29 +753,23 @@ async def match_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     if not await check_if_registered(update, user_id):
         return
     
-    # Show potential matches
-    potential_matches = get_potential_matches(user_id)
+    # Show potential matches, caching the list for the rest of the session
+    potential_queue = get_potential_matches(user_id)
+    context.user_data["potential_queue"] = potential_queue
     
-    if potential_matches:
+    if potential_queue:
         await update.message.reply_text("📱 *Finding Your Match* 📱\n\nSwipe through potential matches and like the ones you're interested in!", parse_mode="Markdown")
         
         # Show multiple potential matches (up to 3 for a better experience)
-        max_matches_to_show = min(3, len(potential_matches))
-        for i in range(max_matches_to_show):
-            match_id = potential_matches[i]
+        max_matches_to_show = min(3, len(potential_queue))
+        for _ in range(max_matches_to_show):
+            match_id = potential_queue.pop(0)
             match_profile = get_user_profile(match_id)
             
             if match_profile:
                 profile_text = format_profile(match_profile, include_personal=False)
                 
-                # Create match decision keyboard
-                keyboard = [
-                    [
-                        InlineKeyboardButton("👎 Pass", callback_data=f"pass_{match_id}"),
-                        InlineKeyboardButton("👍 Like", callback_data=f"like_{match_id}")
-                    ]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
+                reply_markup = _build_match_kb(match_id)
                 
                 # Send profile with photo using the utility function
                 await send_profile_with_photo(
@@ -646,7 +838,7 @@ async def handle_match(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     match_id = int(match_id)
     user_id = update.effective_user.id
     
-    result, liked_data = process_match_decision(user_id, match_id, action == "like")
+    result = await asyncio.to_thread(process_match_decision, user_id, match_id, action == "like")
     
     if result == "match":
         # It's a match!
@@ -668,7 +860,9 @@ async def handle_match(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         )
         
         user_profile = get_user_profile(user_id)
-        await context.bot.send_message(
+        outbox.send(
+            match_id,
+            context.bot.send_message,
             chat_id=match_id,
             text=f"🎉 You have a new match with {user_profile.get('name', 'someone')}! They liked you back.",
             reply_markup=InlineKeyboardMarkup([
@@ -684,27 +878,28 @@ async def handle_match(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         )
         
         # Notify the person who was liked
-        if liked_data and match_id:
-            liker_profile = liked_data.get("sender_profile")
-            if liker_profile:
-                liker_name = liker_profile.get("name", "Someone")
-                
-                # Create a keyboard to view the profile of the person who liked them
-                keyboard = [
-                    [InlineKeyboardButton("View Profile", callback_data=f"view_profile_{user_id}")],
-                    [
-                        InlineKeyboardButton("👎 Pass", callback_data=f"pass_{user_id}"),
-                        InlineKeyboardButton("👍 Like Back", callback_data=f"like_{user_id}")
-                    ]
+        liker_profile = get_user_profile(user_id)
+        if liker_profile:
+            liker_name = liker_profile.get("name", "Someone")
+            
+            # Create a keyboard to view the profile of the person who liked them
+            keyboard = [
+                [InlineKeyboardButton("View Profile", callback_data=f"view_profile_{user_id}")],
+                [
+                    InlineKeyboardButton("👎 Pass", callback_data=f"pass_{user_id}"),
+                    InlineKeyboardButton("👍 Like Back", callback_data=f"like_{user_id}")
                 ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                # Send notification to the person who was liked
-                await context.bot.send_message(
-                    chat_id=match_id,
-                    text=f"❤️ {liker_name} liked your profile! Check out their profile and decide if you want to like them back.",
-                    reply_markup=reply_markup
-                )
+            ]
+            reply_markup = InlineKeyboardMarkup(keyboard)
+            
+            # Send notification to the person who was liked
+            outbox.send(
+                match_id,
+                context.bot.send_message,
+                chat_id=match_id,
+                text=f"❤️ {liker_name} liked your profile! Check out their profile and decide if you want to like them back.",
+                reply_markup=reply_markup
+            )
     
     elif result == "passed":
         # User passed
@@ -714,42 +909,23 @@ async def handle_match(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         )
     
     # Show next potential match if available
-    potential_matches = get_potential_matches(user_id)
+    next_match_id = _pop_potential_match(user_id, context, exclude=match_id)
     
-    if potential_matches:
-        next_match_id = potential_matches[0]
+    if next_match_id is not None:
         next_match_profile = get_user_profile(next_match_id)
         
         if next_match_profile:
             profile_text = format_profile(next_match_profile, include_personal=False)
             
-            # Create match decision keyboard
-            keyboard = [
-                [
-                    InlineKeyboardButton("👎 Pass", callback_data=f"pass_{next_match_id}"),
-                    InlineKeyboardButton("👍 Like", callback_data=f"like_{next_match_id}")
-                ]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            reply_markup = _build_match_kb(next_match_id)
             
             await context.bot.send_message(
                 chat_id=user_id,
                 text="Here's another potential match for you:"
             )
             
-            # Create a custom update object to pass to send_profile_with_photo
-            class CustomUpdate:
-                def __init__(self, user_id):
-                    self.message = type('obj', (object,), {
-                        'chat_id': user_id,
-                        'from_user': type('obj', (object,), {'id': user_id}),
-                        'reply_photo': context.bot.send_photo,
-                        'reply_text': context.bot.send_message
-                    })
-                    self.effective_chat = type('obj', (object,), {'id': user_id})
-                    self.effective_user = type('obj', (object,), {'id': user_id})
-            
-            custom_update = CustomUpdate(user_id)
+            # Send to the user's chat directly rather than replying to an update
+            custom_update = CustomUpdate(context.bot, user_id)
             
             # Send profile with photo using the utility function
             await send_profile_with_photo(
@@ -790,9 +966,10 @@ async def handle_secret_crush(update: Update, context: ContextTypes.DEFAULT_TYPE
     )
     
     # Clear any previous states
-    context.user_data.pop("expecting_crush", None)
-    context.user_data.pop("external_crush_step", None)
-    context.user_data.pop("external_crush_data", None)
+    state = _get_state(context)
+    state.expecting_crush = False
+    state.external_crush_step = None
+    state.external_crush_data = None
 
 
 async def edit_profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -831,59 +1008,87 @@ async def edit_profile_command(update: Update, context: ContextTypes.DEFAULT_TYP
     context.user_data["editing_profile"] = True
 
 
+@dataclass(slots=True)
+class UserState:
+    """Per-user state for the free-text message flows, kept in context.user_data["_state"]."""
+    editing_field: Optional[str] = None  # Profile field being edited
+    external_crush_step: Optional[str] = None  # "name", "social_media" or "photo"
+    external_crush_data: Optional[Dict[str, Any]] = None
+    expecting_crush: bool = False  # Waiting for a registered crush's username or number
+    chatting_with: Optional[int] = None  # Match the user is currently chatting with
+    
+    def is_idle(self) -> bool:
+        """True when no message flow is waiting for the user's text."""
+        return not (self.editing_field or self.external_crush_step or self.expecting_crush
+                    or self.chatting_with is not None)
+
+
+def _get_state(context: ContextTypes.DEFAULT_TYPE) -> UserState:
+    """Get (creating if needed) the user's message-flow state."""
+    state = context.user_data.get("_state")
+    if state is None:
+        state = context.user_data["_state"] = UserState()
+    return state
+
+
+# Free-text profile fields: (min length, max length or None, error message)
+_VALIDATORS = {
+    "name": (3, None, "Please enter a valid name (at least 3 characters)."),
+    "hobbies": (5, None, "Please enter valid hobbies (at least 5 characters)."),
+    "bio": (10, 500, "Please enter a bio between 10 and 500 characters."),
+}
+
+
 async def handle_chat_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle regular chat messages."""
     user_id = update.effective_user.id
     text = update.message.text
+    state = context.user_data.get("_state")
+    
+    # Most stray messages arrive with no flow active, so answer those straight away
+    if state is None or state.is_idle():
+        await update.message.reply_text(
+            "I didn't understand that command. Use /help to see all available commands."
+        )
+        return
     
     # Check if we're editing a profile field
-    if context.user_data.get("editing_field"):
-        field = context.user_data["editing_field"]
+    if state.editing_field:
+        field = state.editing_field
         user_profile = get_user_profile(user_id)
         
-        if field == "name":
-            # Edit name
-            if len(text.strip()) < 3:
-                await update.message.reply_text("Please enter a valid name (at least 3 characters).")
-                return
-            user_profile["name"] = text.strip()
-            
-        elif field == "age":
+        if field == "age":
             # Edit age
             if not is_valid_age(text):
                 await update.message.reply_text("Please enter a valid age (between 18 and 30).")
                 return
             user_profile["age"] = int(text)
             
-        elif field == "hobbies":
-            # Edit hobbies
-            if len(text.strip()) < 5:
-                await update.message.reply_text("Please enter valid hobbies (at least 5 characters).")
-                return
-            user_profile["hobbies"] = text.strip()
-            
-        elif field == "bio":
-            # Edit bio
-            if len(text.strip()) < 10 or len(text.strip()) > 500:
-                await update.message.reply_text("Please enter a bio between 10 and 500 characters.")
+        elif field in _VALIDATORS:
+            # Edit a free-text field
+            value = text.strip()
+            min_len, max_len, error = _VALIDATORS[field]
+            if len(value) < min_len or (max_len is not None and len(value) > max_len):
+                await update.message.reply_text(error)
                 return
-            user_profile["bio"] = text.strip()
-        
-        # Save the updated profile
-        save_user_profile(user_id, user_profile)
+            user_profile[field] = value
         
         # Clear the editing state
-        context.user_data.pop("editing_field")
+        state.editing_field = None
         
-        await update.message.reply_text(
-            f"Your {field.replace('_', ' ')} has been updated. Use /profile to see your complete profile."
+        # Save the updated profile while the confirmation is sent
+        await asyncio.gather(
+            _start_save(user_id, user_profile),
+            update.message.reply_text(
+                f"Your {field.replace('_', ' ')} has been updated. Use /profile to see your complete profile."
+            )
         )
         return
     
     # Check if we're in the external crush flow
-    elif context.user_data.get("external_crush_step"):
-        step = context.user_data["external_crush_step"]
-        external_crush_data = context.user_data.get("external_crush_data", {})
+    elif state.external_crush_step:
+        step = state.external_crush_step
+        external_crush_data = state.external_crush_data or {}
         
         if step == "name":
             # Validate name
@@ -895,8 +1100,8 @@ async def handle_chat_message(update: Update, context: ContextTypes.DEFAULT_TYPE
             external_crush_data["name"] = text.strip()
             
             # Move to next step
-            context.user_data["external_crush_step"] = "social_media"
-            context.user_data["external_crush_data"] = external_crush_data
+            state.external_crush_step = "social_media"
+            state.external_crush_data = external_crush_data
             
             await update.message.reply_text(
                 "Great! Now please enter your crush's social media account (Instagram or Telegram handle). "
@@ -910,8 +1115,8 @@ async def handle_chat_message(update: Update, context: ContextTypes.DEFAULT_TYPE
                 external_crush_data["social_media"] = text.strip()
             
             # Move to next step
-            context.user_data["external_crush_step"] = "photo"
-            context.user_data["external_crush_data"] = external_crush_data
+            state.external_crush_step = "photo"
+            state.external_crush_data = external_crush_data
             
             await update.message.reply_text(
                 "Now, if you have a photo of your crush, please send it. "
@@ -926,7 +1131,8 @@ async def handle_chat_message(update: Update, context: ContextTypes.DEFAULT_TYPE
                 name = external_crush_data.get("name", "")
                 social_media = external_crush_data.get("social_media", "")
                 
-                result = add_secret_crush(
+                result = await asyncio.to_thread(
+                    add_secret_crush,
                     user_id=user_id,
                     crush_id=None,
                     crush_name=name,
@@ -944,97 +1150,58 @@ async def handle_chat_message(update: Update, context: ContextTypes.DEFAULT_TYPE
                     )
                 
                 # Clear the state
-                context.user_data.pop("external_crush_step", None)
-                context.user_data.pop("external_crush_data", None)
+                state.external_crush_step = None
+                state.external_crush_data = None
             
             # If not skip, they should send a photo, so we keep the state
             return
     
     # Check if we're expecting a secret crush username
-    elif context.user_data.get("expecting_crush"):
+    elif state.expecting_crush:
         # Handle secret crush username
-        context.user_data["expecting_crush"] = False
+        state.expecting_crush = False
         
         # Check if it's either a number for the list index or a valid username
         if text.isdigit():
-            # Try to use the index from the displayed list
-            try:
-                crush_index = int(text) - 1  # Convert to 0-based index
-                
-                from app import db, app
-                from models import User
-                
-                with app.app_context():
-                    users = db.session.query(User).filter(User.telegram_id != user_id).all()
-                    
-                    if crush_index < 0 or crush_index >= len(users):
-                        await update.message.reply_text(
-                            f"Invalid number. Please choose a number between 1 and {len(users)}."
-                        )
-                        return
-                    
-                    crush_user = users[crush_index]
-                    crush_id = crush_user.telegram_id
-            except Exception as e:
-                logging.error(f"Error processing crush by index: {e}")
+            # Use the index into the list shown by the crush_registered callback
+            crush_list_ids = context.user_data.get("crush_list_ids", [])
+            crush_index = int(text) - 1  # Convert to 0-based index
+            
+            if crush_index < 0 or crush_index >= len(crush_list_ids):
                 await update.message.reply_text(
-                    "An error occurred while processing your selection. Please try again."
+                    f"Invalid number. Please choose a number between 1 and {len(crush_list_ids)}."
                 )
                 return
+            
+            crush_id = crush_list_ids[crush_index]
         elif text.startswith("@") and len(text) >= 2:
             # Handle username format
             crush_username = text[1:]  # Remove the @ symbol
-        else:
-            await update.message.reply_text(
-                "That doesn't look like a valid input. Please use the format @username or enter a number from the list."
-            )
-            return
-        
-        # We need to search for users by username or user ID
-        try:
-            # First check if the text is a number (direct Telegram ID)
+            
             if crush_username.isdigit():
+                # A direct Telegram ID (our own ID falls through to the self-crush check)
                 crush_id = int(crush_username)
-                crush_profile = get_user_profile(crush_id)
-                if not crush_profile:
+                if crush_id != user_id and not get_user_profile(crush_id):
                     await update.message.reply_text(
                         "No user found with that ID. They need to register with the bot first."
                     )
                     return
             else:
-                # Try to look up user by username in our database
-                from app import db, app
-                from models import User
-                
-                with app.app_context():
-                    # Search for any user who might have saved this username
-                    # This is a simplified search - in a real app, you'd integrate with Telegram's getChat API
-                    # to resolve usernames to user IDs
-                    users = db.session.query(User).all()
-                    crush_user = None
-                    
-                    for user in users:
-                        user_profile = get_user_profile(user.telegram_id)
-                        if user_profile and "username" in user_profile and user_profile["username"] == crush_username:
-                            crush_user = user
-                            break
-                    
-                    if not crush_user:
-                        await update.message.reply_text(
-                            "I couldn't find that user. They might not have registered with the bot yet, or you might "
-                            "have entered the wrong username."
-                        )
-                        return
-                    
-                    crush_id = crush_user.telegram_id
-        except Exception as e:
-            logging.error(f"Error looking up crush by username: {e}")
+                # Indexed lookup on the stored Telegram username
+                crush_id = await asyncio.to_thread(find_user_id_by_username, crush_username)
+                if crush_id is None:
+                    await update.message.reply_text(
+                        "I couldn't find that user. They might not have registered with the bot yet, or you might "
+                        "have entered the wrong username."
+                    )
+                    return
+        else:
             await update.message.reply_text(
-                "An error occurred while looking up that user. Please try again later."
+                "That doesn't look like a valid input. Please use the format @username or enter a number from the list."
             )
             return
         
-        # Don't allow self-crush
+        # Don't allow self-crush, before any database work for the crush
         if crush_id == user_id:
             await update.message.reply_text(
                 "You can't add yourself as a secret crush! Try someone else 😊"
@@ -1042,7 +1209,7 @@ async def handle_chat_message(update: Update, context: ContextTypes.DEFAULT_TYPE
             return
             
         # Add the secret crush
-        result = add_secret_crush(user_id, crush_id)
+        result = await asyncio.to_thread(add_secret_crush, user_id, crush_id)
         
         if result == "added":
             # Get the crush's profile to show their name and photo
@@ -1055,19 +1222,20 @@ async def handle_chat_message(update: Update, context: ContextTypes.DEFAULT_TYPE
                 )
                 
                 # If they have a profile picture, send it as well
-                photo_bytes = get_profile_picture(crush_profile)
-                if photo_bytes:
-                    await update.message.reply_photo(
-                        photo=photo_bytes,
+                crush_photo = await get_profile_photo(crush_profile)
+                if crush_photo:
+                    message = await update.message.reply_photo(
+                        photo=crush_photo,
                         caption="This is your secret crush 💘"
                     )
+                    await remember_photo_file_id(crush_profile, message)
             else:
                 await update.message.reply_text(
                     f"Secret crush added! They won't be notified unless they add you as a crush too."
                 )
             
             # Check if it's a mutual crush
-            if check_mutual_crush(user_id, crush_id):
+            if await asyncio.to_thread(check_mutual_crush, user_id, crush_id):
                 # It's a mutual crush! Send enhanced notifications with profile pictures
                 await send_mutual_crush_notification(context, user_id, crush_id)
         
@@ -1080,125 +1248,86 @@ async def handle_chat_message(update: Update, context: ContextTypes.DEFAULT_TYPE
             )
     
     # Check if we're in a chat with someone
-    elif "chatting_with" in context.user_data:
-        recipient_id = context.user_data["chatting_with"]
+    elif state.chatting_with is not None:
+        recipient_id = state.chatting_with
         
-        # Add message to chat history
-        add_chat_message(user_id, recipient_id, text)
+        # Add message to chat history (written to the database in the background)
+        chat_writer.enqueue(user_id, recipient_id, text)
         
         # Forward the message to the recipient
         sender_profile = get_user_profile(user_id)
         sender_name = sender_profile.get("name", "Anonymous")
         
-        await context.bot.send_message(
+        outbox.send(
+            recipient_id,
+            context.bot.send_message,
             chat_id=recipient_id,
             text=f"Message from {sender_name}:\n\n{text}"
         )
-    
-    else:
-        # Regular message, provide help
-        await update.message.reply_text(
-            "I didn't understand that command. Use /help to see all available commands."
-        )
 
 
-async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Handle inline button callbacks."""
+async def _handle_view_profile(update: Update, context: ContextTypes.DEFAULT_TYPE, parts: List[str]) -> None:
+    """Show the full profile of someone who liked the user (view_profile_<id>)."""
     query = update.callback_query
-    await query.answer()
-    
-    # Parse the callback data
-    data = query.data
     user_id = update.effective_user.id
-    user_profile = get_user_profile(user_id)
+    profile_id = int(parts[2])
+    profile = get_user_profile(profile_id)
     
-    # Handle view profile request (from like notifications)
-    if data.startswith("view_profile_"):
-        profile_id = int(data.split("_")[2])
-        profile = get_user_profile(profile_id)
+    if profile:
+        profile_text = format_profile(profile, include_personal=False)
         
-        if profile:
-            profile_text = format_profile(profile, include_personal=False)
-            
-            # Create action keyboard
-            keyboard = [
-                [
-                    InlineKeyboardButton("👎 Pass", callback_data=f"pass_{profile_id}"),
-                    InlineKeyboardButton("👍 Like", callback_data=f"like_{profile_id}")
-                ]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            # Create a custom update object to send the profile
-            class CustomUpdate:
-                def __init__(self, user_id):
-                    self.message = type('obj', (object,), {
-                        'chat_id': user_id,
-                        'from_user': type('obj', (object,), {'id': user_id}),
-                        'reply_photo': context.bot.send_photo,
-                        'reply_text': context.bot.send_message
-                    })
-                    self.effective_chat = type('obj', (object,), {'id': user_id})
-                    self.effective_user = type('obj', (object,), {'id': user_id})
-            
-            custom_update = CustomUpdate(user_id)
-            
-            # Delete the original query message
-            await query.delete_message()
-            
-            # Send the full profile
-            await send_profile_with_photo(
-                custom_update, 
-                profile, 
-                caption=profile_text, 
-                reply_markup=reply_markup,
-                include_personal=False
-            )
-            return
+        reply_markup = _build_match_kb(profile_id)
+        
+        # Send to the user's chat directly rather than replying to an update
+        custom_update = CustomUpdate(context.bot, user_id)
+        
+        # Delete the original query message
+        await query.delete_message()
+        
+        # Send the full profile
+        await send_profile_with_photo(
+            custom_update, 
+            profile, 
+            caption=profile_text, 
+            reply_markup=reply_markup,
+            include_personal=False
+        )
+
+
+async def _handle_crush(update: Update, context: ContextTypes.DEFAULT_TYPE, parts: List[str]) -> None:
+    """Handle the secret crush type selection (crush_registered / crush_external)."""
+    query = update.callback_query
+    user_id = update.effective_user.id
+    crush_type = parts[1] if len(parts) > 1 else ""
     
-    # Handle Secret Crush registration flow
-    if data == "crush_registered":
+    if crush_type == "registered":
         # Show registered users for crush selection
-        from app import db, app
-        from models import User
+        crush_list_ids, user_list = await asyncio.to_thread(_get_crush_list, user_id)
         
-        with app.app_context():
-            # Get a list of users that could be selected as crush
-            users = db.session.query(User).filter(User.telegram_id != user_id).all()
-            
-            if not users:
-                await query.edit_message_text(
-                    "💔 There are no other registered users in the system yet. "
-                    "Please try again when more people have joined the dating bot."
-                )
-                return
-            
-            # Create a message showing registered users to help the person choose
-            user_list = "Here are some registered users you might want to add as a crush:\n\n"
-            for idx, user in enumerate(users, 1):
-                user_profile = get_user_profile(user.telegram_id)
-                if user_profile:
-                    name = user_profile.get("name", "Anonymous")
-                    gender = user_profile.get("gender", "Unknown")
-                    university = user_profile.get("university", "Unknown University")
-                    user_list += f"{idx}. {name} - {gender} at {university}\n"
-            
-            user_list += "\n"
-            
+        if not crush_list_ids:
             await query.edit_message_text(
-                "💖 *Secret Crush* 💖\n\n"
-                "Add someone as your secret crush and they'll only be notified if they add you too!\n\n" + 
-                user_list +
-                "Send me the Telegram username of your crush (e.g., @username) or their ID number:\n\n"
-                "Note: If you know their Telegram username, use @username format.\n"
-                "If you know their ID number (from the list above), you can use that directly.",
-                parse_mode="Markdown"
+                "💔 There are no other registered users in the system yet. "
+                "Please try again when more people have joined the dating bot."
             )
-            
-            # Set the next state
-            context.user_data["expecting_crush"] = True
-            
-    elif data == "crush_external":
+            return
+        
+        # Remember the order shown so a numeric reply maps straight to a user
+        context.user_data["crush_list_ids"] = crush_list_ids
+        
+        await query.edit_message_text(
+            "💖 *Secret Crush* 💖\n\n"
+            "Add someone as your secret crush and they'll only be notified if they add you too!\n\n" + 
+            user_list +
+            "Send me the Telegram username of your crush (e.g., @username) or their ID number:\n\n"
+            "Note: If you know their Telegram username, use @username format.\n"
+            "If you know their ID number (from the list above), you can use that directly.",
+            parse_mode="Markdown"
+        )
+        
+        # Set the next state
+        _get_state(context).expecting_crush = True
+    
+    elif crush_type == "external":
         # Start external crush registration flow
         await query.edit_message_text(
             "💖 *External Secret Crush* 💖\n\n"
@@ -1208,270 +1337,274 @@ async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TY
         )
         
         # Initialize external crush data
-        context.user_data["external_crush_step"] = "name"
-        context.user_data["external_crush_data"] = {}
+        state = _get_state(context)
+        state.external_crush_step = "name"
+        state.external_crush_data = {}
+
+
+async def _handle_edit(update: Update, context: ContextTypes.DEFAULT_TYPE, parts: List[str]) -> None:
+    """Handle the /edit_profile options (edit_<field>) and relationship choices (edit_rel_<idx>)."""
+    query = update.callback_query
+    edit_field = parts[1] if len(parts) > 1 else ""
     
-    # Handle editing profile options
-    if data.startswith("edit_"):
-        parts = data.split("_")
-        edit_field = parts[1] if len(parts) > 1 else ""
+    if edit_field == "name":
+        await query.edit_message_text("Please send me your new name:")
+        _get_state(context).editing_field = "name"
         
-        if edit_field == "name":
-            await query.edit_message_text("Please send me your new name:")
-            context.user_data["editing_field"] = "name"
-            return
-            
-        elif edit_field == "age":
-            await query.edit_message_text("Please send me your new age (must be between 18 and 30):")
-            context.user_data["editing_field"] = "age"
-            return
-            
-        elif edit_field == "gender":
-            keyboard = [
-                [
-                    InlineKeyboardButton("Male", callback_data="gender_male"),
-                    InlineKeyboardButton("Female", callback_data="gender_female")
-                ]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await query.edit_message_text(
-                "Please select your gender:",
-                reply_markup=reply_markup
-            )
-            return
-            
-        elif edit_field == "pic":
-            await query.edit_message_text("Please send me your new profile picture:")
-            context.user_data["editing_field"] = "profile_pic"
-            return
-            
-        elif edit_field == "university":
-            # Create university selection keyboard
-            universities = get_university_list()
-            keyboard = []
-            for i in range(0, len(universities), 2):
-                row = []
-                row.append(InlineKeyboardButton(universities[i], callback_data=f"uni_{i}"))
-                if i + 1 < len(universities):
-                    row.append(InlineKeyboardButton(universities[i+1], callback_data=f"uni_{i+1}"))
-                keyboard.append(row)
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await query.edit_message_text(
-                "Please select your university:",
-                reply_markup=reply_markup
-            )
-            return
-            
-        elif edit_field == "target_unis":
-            # Create target university selection keyboard
-            universities = get_university_list()
-            keyboard = []
-            for i in range(0, len(universities), 2):
-                row = []
-                row.append(InlineKeyboardButton(universities[i], callback_data=f"target_uni_{i}"))
-                if i + 1 < len(universities):
-                    row.append(InlineKeyboardButton(universities[i+1], callback_data=f"target_uni_{i+1}"))
-                keyboard.append(row)
-            
-            # Add "All Universities" option
-            keyboard.append([InlineKeyboardButton("All Universities", callback_data="target_uni_all")])
-            
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await query.edit_message_text(
-                "Please select which universities you want to match with:",
-                reply_markup=reply_markup
-            )
-            return
-            
-        elif edit_field == "hobbies":
-            await query.edit_message_text("Please send me your new hobbies:")
-            context.user_data["editing_field"] = "hobbies"
-            return
-            
-        elif edit_field == "bio":
-            await query.edit_message_text("Please send me your new bio (between 10 and 500 characters):")
-            context.user_data["editing_field"] = "bio"
-            return
-            
-        elif edit_field == "rel":
-            # Create relationship preference keyboard
-            keyboard = []
-            for i in range(0, len(RELATIONSHIP_TYPES), 2):
-                row = []
-                row.append(InlineKeyboardButton(RELATIONSHIP_TYPES[i], callback_data=f"edit_rel_{i}"))
-                if i + 1 < len(RELATIONSHIP_TYPES):
-                    row.append(InlineKeyboardButton(RELATIONSHIP_TYPES[i+1], callback_data=f"edit_rel_{i+1}"))
-                keyboard.append(row)
-            
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await query.edit_message_text(
-                "What type of relationship are you looking for?",
-                reply_markup=reply_markup
-            )
-            return
-    
-    # Handle gender selection for profile editing
-    elif data.startswith("gender_"):
-        gender = data.split("_")[1]
-        if user_profile:
-            user_profile["gender"] = gender
-            save_user_profile(user_id, user_profile)
+    elif edit_field == "age":
+        await query.edit_message_text("Please send me your new age (must be between 18 and 30):")
+        _get_state(context).editing_field = "age"
         
+    elif edit_field == "gender":
         await query.edit_message_text(
-            f"Your gender has been updated to {gender}. Use /profile to see your updated profile."
+            "Please select your gender:",
+            reply_markup=_GENDER_KEYBOARD
         )
-        return
-    
-    # Handle university selection for profile editing
-    elif data.startswith("uni_"):
-        uni_idx = int(data.split("_")[1])
-        universities = get_university_list()
-        uni = universities[uni_idx]
         
-        if user_profile:
-            user_profile["university"] = uni
-            save_user_profile(user_id, user_profile)
+    elif edit_field == "pic":
+        await query.edit_message_text("Please send me your new profile picture:")
+        _get_state(context).editing_field = "profile_pic"
         
+    elif edit_field == "university":
         await query.edit_message_text(
-            f"Your university has been updated to {uni}. Use /profile to see your updated profile."
+            "Please select your university:",
+            reply_markup=_UNI_KEYBOARD
         )
-        return
-    
-    # Handle target university selection for profile editing
-    elif data.startswith("target_uni_"):
-        target = data.split("_")[2]
         
-        if user_profile:
-            if target == "all":
-                user_profile["target_universities"] = ["All Universities"]
-            else:
-                uni_idx = int(target)
-                universities = get_university_list()
-                uni = universities[uni_idx]
-                user_profile["target_universities"] = [uni]
-            
-            save_user_profile(user_id, user_profile)
-            
-            target_unis = ", ".join(user_profile["target_universities"])
-            await query.edit_message_text(
-                f"Your target universities have been updated to {target_unis}. Use /profile to see your updated profile."
-            )
-        else:
-            await query.edit_message_text(
-                "Error updating profile. Please try again."
-            )
-        return
+    elif edit_field == "target":
+        await query.edit_message_text(
+            "Please select which universities you want to match with:",
+            reply_markup=_EDIT_TARGET_KEYBOARD
+        )
+        
+    elif edit_field == "hobbies":
+        await query.edit_message_text("Please send me your new hobbies:")
+        _get_state(context).editing_field = "hobbies"
+        
+    elif edit_field == "bio":
+        await query.edit_message_text("Please send me your new bio (between 10 and 500 characters):")
+        _get_state(context).editing_field = "bio"
+        
+    elif edit_field == "rel" and len(parts) > 2:
+        # Relationship preference selected for profile editing
+        await _handle_edit_rel(update, context, int(parts[2]))
+        
+    elif edit_field == "rel":
+        await query.edit_message_text(
+            "What type of relationship are you looking for?",
+            reply_markup=_EDIT_REL_KEYBOARD
+        )
+
+
+async def _handle_edit_rel(update: Update, context: ContextTypes.DEFAULT_TYPE, rel_idx: int) -> None:
+    """Save the relationship preference picked while editing the profile."""
+    query = update.callback_query
+    user_id = update.effective_user.id
+    user_profile = get_user_profile(user_id)
+    relationship = RELATIONSHIP_TYPES[rel_idx]
     
-    # Handle relationship preference selection for profile editing
-    elif data.startswith("edit_rel_"):
-        rel_idx = int(data.split("_")[2])
-        relationship = RELATIONSHIP_TYPES[rel_idx]
+    if user_profile:
+        user_profile["relationship_preference"] = relationship
         
-        if user_profile:
-            user_profile["relationship_preference"] = relationship
-            save_user_profile(user_id, user_profile)
-            
-            await query.edit_message_text(
+        await asyncio.gather(
+            _start_save(user_id, user_profile),
+            query.edit_message_text(
                 f"Your relationship preference has been updated to {relationship}. Use /profile to see your updated profile."
             )
-        else:
-            await query.edit_message_text(
-                "Error updating profile. Please try again."
-            )
-        return
-    
-    # Handle cancel edit
-    elif data == "cancel_edit":
-        context.user_data.pop("editing_profile", None)
-        context.user_data.pop("editing_field", None)
-        
+        )
+    else:
         await query.edit_message_text(
-            "Profile editing cancelled. Use /profile to see your current profile."
+            "Error updating profile. Please try again."
         )
+
+
+async def _handle_gender(update: Update, context: ContextTypes.DEFAULT_TYPE, parts: List[str]) -> None:
+    """Handle gender selection for profile editing (gender_<gender>)."""
+    query = update.callback_query
+    user_id = update.effective_user.id
+    user_profile = get_user_profile(user_id)
+    gender = parts[1]
+    
+    reply = query.edit_message_text(
+        f"Your gender has been updated to {gender}. Use /profile to see your updated profile."
+    )
+    
+    if user_profile:
+        user_profile["gender"] = gender
+        await asyncio.gather(_start_save(user_id, user_profile), reply)
+    else:
+        await reply
+
+
+async def _handle_uni(update: Update, context: ContextTypes.DEFAULT_TYPE, parts: List[str]) -> None:
+    """Handle university selection for profile editing (uni_<idx>)."""
+    query = update.callback_query
+    user_id = update.effective_user.id
+    user_profile = get_user_profile(user_id)
+    uni = _UNIVERSITIES[int(parts[1])]
+    
+    reply = query.edit_message_text(
+        f"Your university has been updated to {uni}. Use /profile to see your updated profile."
+    )
+    
+    if user_profile:
+        user_profile["university"] = uni
+        await asyncio.gather(_start_save(user_id, user_profile), reply)
+    else:
+        await reply
+
+
+async def _handle_target_uni(update: Update, context: ContextTypes.DEFAULT_TYPE, parts: List[str]) -> None:
+    """Handle target university selection for profile editing (target_uni_<idx|all>)."""
+    if len(parts) < 3 or parts[1] != "uni":
+        # Registration's target_<idx> buttons are handled by the conversation
         return
     
-    # Parse the original callback data
-    parts = data.split("_")
-    action = parts[0]
-    
-    if action in ["like", "pass"]:
-        # Handle match decisions
-        await handle_match(update, context)
-    
-    elif action == "chat":
-        # Start a chat with a match
-        match_id = int(parts[1])
-        user_id = update.effective_user.id
-        
-        # Set the active chat
-        context.user_data["chatting_with"] = match_id
-        
-        # Get chat history
-        chat_history = get_chat_history(user_id, match_id)
-        
-        if chat_history:
-            # Display chat history
-            history_text = "--- Chat History ---\n\n"
-            for msg in chat_history:
-                sender_id = msg["sender_id"]
-                sender_profile = get_user_profile(sender_id)
-                sender_name = sender_profile.get("name", "Anonymous")
-                history_text += f"{sender_name}: {msg['text']}\n"
-            
-            await query.edit_message_text(
-                text=f"{history_text}\n\n✅ You are now connected with your match. Simply type messages to chat."
-            )
-        else:
-            # No chat history
-            match_profile = get_user_profile(match_id)
-            match_name = match_profile.get("name", "your match")
-            
-            await query.edit_message_text(
-                text=f"✅ You are now connected with {match_name}. This is the beginning of your conversation. "
-                     f"Simply type messages to chat."
-            )
+    query = update.callback_query
+    user_id = update.effective_user.id
+    user_profile = get_user_profile(user_id)
+    target = parts[2]
     
-    elif action == "block":
-        # Block a user
-        match_id = int(parts[1])
-        user_id = update.effective_user.id
-        
-        block_user_from_db(user_id, match_id)
+    if user_profile:
+        if target == "all":
+            user_profile["target_universities"] = ["All Universities"]
+        else:
+            user_profile["target_universities"] = [_UNIVERSITIES[int(target)]]
         
-        await query.edit_message_reply_markup(reply_markup=None)
+        target_unis = ", ".join(user_profile["target_universities"])
+        await asyncio.gather(
+            _start_save(user_id, user_profile),
+            query.edit_message_text(
+                f"Your target universities have been updated to {target_unis}. Use /profile to see your updated profile."
+            )
+        )
+    else:
         await query.edit_message_text(
-            text="You have blocked this user. They can no longer contact you."
+            "Error updating profile. Please try again."
         )
+
+
+async def _handle_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE, parts: List[str]) -> None:
+    """Handle cancelling the profile edit (cancel_edit)."""
+    if len(parts) < 2 or parts[1] != "edit":
+        return
+    
+    context.user_data.pop("editing_profile", None)
+    _get_state(context).editing_field = None
+    
+    await update.callback_query.edit_message_text(
+        "Profile editing cancelled. Use /profile to see your current profile."
+    )
+
+
+async def _handle_match_decision(update: Update, context: ContextTypes.DEFAULT_TYPE, parts: List[str]) -> None:
+    """Handle a like/pass button (like_<id> / pass_<id>)."""
+    await handle_match(update, context)
+
+
+async def _handle_chat(update: Update, context: ContextTypes.DEFAULT_TYPE, parts: List[str]) -> None:
+    """Start a chat with a match (chat_<id>)."""
+    query = update.callback_query
+    user_id = update.effective_user.id
+    match_id = int(parts[1])
+    
+    # Set the active chat
+    _get_state(context).chatting_with = match_id
+    
+    # Get chat history
+    chat_history = await asyncio.to_thread(get_chat_history, user_id, match_id)
     
-    elif action == "report":
-        # Report a user
-        match_id = int(parts[1])
-        user_id = update.effective_user.id
+    match_profile = get_user_profile(match_id)
+    
+    if chat_history:
+        # Resolve both participants' names once instead of once per message
+        sender_names = {
+            user_id: (get_user_profile(user_id) or {}).get("name", "Anonymous"),
+            match_id: (match_profile or {}).get("name", "Anonymous")
+        }
         
-        report_user_to_db(user_id, match_id)
+        # Display chat history
+        history_text = "--- Chat History ---\n\n" + "".join(
+            f"{sender_names.get(msg['sender_id'], 'Anonymous')}: {msg['text']}\n"
+            for msg in chat_history
+        )
         
-        await query.edit_message_reply_markup(reply_markup=None)
         await query.edit_message_text(
-            text="Thank you for your report. We'll review this user's profile."
+            text=f"{history_text}\n\n✅ You are now connected with your match. Simply type messages to chat."
         )
-    
-    elif action == "unmatch":
-        # Unmatch a user
-        match_id = int(parts[1])
-        user_id = update.effective_user.id
-        
-        unmatch_user_from_db(user_id, match_id)
+    else:
+        # No chat history
+        match_name = (match_profile or {}).get("name", "your match")
         
-        await query.edit_message_reply_markup(reply_markup=None)
         await query.edit_message_text(
-            text="You have unmatched with this user."
+            text=f"✅ You are now connected with {match_name}. This is the beginning of your conversation. "
+                 f"Simply type messages to chat."
         )
 
 
+async def _handle_block(update: Update, context: ContextTypes.DEFAULT_TYPE, parts: List[str]) -> None:
+    """Block a user (block_<id>)."""
+    query = update.callback_query
+    await asyncio.to_thread(block_user_from_db, update.effective_user.id, int(parts[1]))
+    
+    await query.edit_message_reply_markup(reply_markup=None)
+    await query.edit_message_text(
+        text="You have blocked this user. They can no longer contact you."
+    )
+
+
+async def _handle_report(update: Update, context: ContextTypes.DEFAULT_TYPE, parts: List[str]) -> None:
+    """Report a user (report_<id>)."""
+    query = update.callback_query
+    await asyncio.to_thread(report_user_to_db, update.effective_user.id, int(parts[1]))
+    
+    await query.edit_message_reply_markup(reply_markup=None)
+    await query.edit_message_text(
+        text="Thank you for your report. We'll review this user's profile."
+    )
+
+
+async def _handle_unmatch(update: Update, context: ContextTypes.DEFAULT_TYPE, parts: List[str]) -> None:
+    """Unmatch a user (unmatch_<id>)."""
+    query = update.callback_query
+    await asyncio.to_thread(unmatch_user_from_db, update.effective_user.id, int(parts[1]))
+    
+    await query.edit_message_reply_markup(reply_markup=None)
+    await query.edit_message_text(
+        text="You have unmatched with this user."
+    )
+
+
+# Callback data prefix -> handler, each receiving the data pre-split on "_"
+_CB_HANDLERS = {
+    "view": _handle_view_profile,
+    "crush": _handle_crush,
+    "edit": _handle_edit,
+    "gender": _handle_gender,
+    "uni": _handle_uni,
+    "target": _handle_target_uni,
+    "cancel": _handle_cancel,
+    "like": _handle_match_decision,
+    "pass": _handle_match_decision,
+    "chat": _handle_chat,
+    "block": _handle_block,
+    "report": _handle_report,
+    "unmatch": _handle_unmatch,
+}
+
+
+async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle inline button callbacks."""
+    query = update.callback_query
+    await query.answer()
+    
+    # Split the callback data once and dispatch on its prefix
+    parts = query.data.split("_", 2)
+    handler = _CB_HANDLERS.get(parts[0])
+    if handler:
+        await handler(update, context, parts)
+
+
 async def block_user(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Block a user."""
     # This will be handled by the callback query handler
@@ -1494,14 +1627,16 @@ async def cancel_chat_command(update: Update, context: ContextTypes.DEFAULT_TYPE
     """Exit the current chat conversation."""
     user_id = update.effective_user.id
     
-    if "chatting_with" in context.user_data:
-        recipient_id = context.user_data["chatting_with"]
+    state = _get_state(context)
+    
+    if state.chatting_with is not None:
+        recipient_id = state.chatting_with
         # Get the match's profile to show their name
         match_profile = get_user_profile(recipient_id)
         match_name = match_profile.get("name", "your match") if match_profile else "your match"
         
         # Clear the chat state
-        recipient_id = context.user_data.pop("chatting_with")
+        state.chatting_with = None
         
         await update.message.reply_text(
             f"You have exited the chat with {match_name}. Use /matches to see your other matches or start a new chat.\n\n"
@@ -1530,27 +1665,28 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     user_id = update.effective_user.id
     
     # Check if we're in the external crush flow and expecting a photo
-    if context.user_data.get("external_crush_step") == "photo":
-        external_crush_data = context.user_data.get("external_crush_data", {})
+    state = _get_state(context)
+    
+    if state.external_crush_step == "photo":
+        external_crush_data = state.external_crush_data or {}
         
         # Get the photo with best resolution
         photo = update.message.photo[-1]
         photo_file = await context.bot.get_file(photo.file_id)
-        photo_bytes = await photo_file.download_as_bytearray()
-        
-        # Convert to hex string for storage
-        photo_hex = photo_bytes.hex()
+        photo_bytes = await _download_photo(photo_file)
         
         # Add crush with photo
         name = external_crush_data.get("name", "")
         social_media = external_crush_data.get("social_media", "")
         
-        result = add_secret_crush(
+        # The database write runs in a worker thread so other updates aren't blocked
+        result = await asyncio.to_thread(
+            add_secret_crush,
             user_id=user_id,
             crush_id=None,
             crush_name=name,
             social_media_account=social_media,
-            crush_photo=photo_hex
+            crush_photo=photo_bytes
         )
         
         if result == "added_external":
@@ -1570,32 +1706,32 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
             )
         
         # Clear the state
-        context.user_data.pop("external_crush_step", None)
-        context.user_data.pop("external_crush_data", None)
+        state.external_crush_step = None
+        state.external_crush_data = None
     
     # If we're editing the profile picture
-    elif context.user_data.get("editing_field") == "profile_pic":
+    elif state.editing_field == "profile_pic":
         user_profile = get_user_profile(user_id)
         if user_profile:
             # Get the photo with best resolution
             photo = update.message.photo[-1]
             photo_file = await context.bot.get_file(photo.file_id)
-            photo_bytes = await photo_file.download_as_bytearray()
-            
-            # Convert to hex string for storage
-            photo_hex = photo_bytes.hex()
+            photo_bytes = await _download_photo(photo_file)
             
-            # Update profile
-            user_profile["profile_pic"] = photo_hex
-            save_user_profile(user_id, user_profile)
+            # Update profile (stored as raw bytes, plus the file_id for re-sending)
+            user_profile["profile_pic"] = photo_bytes
+            user_profile["profile_pic_file_id"] = photo.file_id
             
-            # Send confirmation
-            await update.message.reply_text(
-                "Your profile picture has been updated. Use /profile to see your updated profile."
+            # Save in a worker thread while the confirmation is sent
+            await asyncio.gather(
+                _start_save(user_id, user_profile),
+                update.message.reply_text(
+                    "Your profile picture has been updated. Use /profile to see your updated profile."
+                )
             )
             
             # Clear editing state
-            context.user_data.pop("editing_field", None)
+            state.editing_field = None
     
     # If not expecting any photo, just provide help
     else:
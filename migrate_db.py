@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Script to migrate an existing database to the current schema
+"""
+
+from sqlalchemy import inspect, text
+from app import app, db
+import models  # Import all models
+
+
+def convert_hex_column(table, column):
+    """Convert a hex encoded text column to raw bytes (BYTEA)"""
+    with db.engine.begin() as conn:
+        column_type = conn.execute(text(
+            "SELECT data_type FROM information_schema.columns "
+            "WHERE table_name = :table AND column_name = :column"
+        ), {"table": table, "column": column}).scalar()
+
+        if column_type == "bytea":
+            print(f"{table}.{column} is already stored as BYTEA")
+            return
+
+        print(f"Converting {table}.{column} from hex text to BYTEA...")
+        conn.execute(text(
+            f"ALTER TABLE {table} ALTER COLUMN {column} TYPE BYTEA "
+            f"USING decode(NULLIF({column}, ''), 'hex')"
+        ))
+
+
+def convert_photos():
+    """Convert hex encoded profile and crush photos to raw bytes"""
+    if db.engine.dialect.name != "postgresql":
+        print("Skipping photo conversion (only needed on PostgreSQL)")
+        return
+
+    convert_hex_column("users", "profile_pic")
+    convert_hex_column("secret_crushes", "crush_photo")
+
+
+def add_username_column():
+    """Add the indexed users.username column used for secret crush lookups"""
+    with db.engine.begin() as conn:
+        columns = {column["name"] for column in inspect(conn).get_columns("users")}
+
+        if "username" not in columns:
+            print("Adding users.username column...")
+            conn.execute(text("ALTER TABLE users ADD COLUMN username VARCHAR(100)"))
+
+        # Usernames were never persisted before this column existed, so there is
+        # nothing to backfill; they are written on each user's next profile save
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_users_username ON users (username)"))
+
+
+def add_profile_pic_file_id_column():
+    """Add the users.profile_pic_file_id column used to re-send photos by file_id"""
+    with db.engine.begin() as conn:
+        columns = {column["name"] for column in inspect(conn).get_columns("users")}
+
+        if "profile_pic_file_id" not in columns:
+            print("Adding users.profile_pic_file_id column...")
+            conn.execute(text("ALTER TABLE users ADD COLUMN profile_pic_file_id VARCHAR(255)"))
+
+
+# (index name, table, columns, unique) for the lookup indexes declared in models.py
+INDEXES = [
+    ("ix_target_univ_user", "target_universities", "user_id", False),
+    ("uq_like_pair", "likes", "sender_id, receiver_id", True),
+    ("ix_like_receiver_sender", "likes", "receiver_id, sender_id, is_match", False),
+    ("ix_msg_pair", "messages", "sender_id, receiver_id, created_at", False),
+    ("ix_crush_pair", "secret_crushes", "crusher_id, crushee_id", False),
+    ("ix_block_pair", "blocks", "blocker_id, blocked_id", True),
+]
+
+
+def remove_duplicate_pairs():
+    """Remove duplicate likes and blocks so the unique pair indexes can be built"""
+    with db.engine.begin() as conn:
+        # Keep the match flag of any duplicate on the row that survives
+        conn.execute(text(
+            "UPDATE likes SET is_match = TRUE WHERE EXISTS ("
+            "SELECT 1 FROM likes d WHERE d.sender_id = likes.sender_id "
+            "AND d.receiver_id = likes.receiver_id AND d.is_match)"
+        ))
+        likes = conn.execute(text(
+            "DELETE FROM likes WHERE id NOT IN ("
+            "SELECT MIN(id) FROM likes GROUP BY sender_id, receiver_id)"
+        ))
+        blocks = conn.execute(text(
+            "DELETE FROM blocks WHERE id NOT IN ("
+            "SELECT MIN(id) FROM blocks GROUP BY blocker_id, blocked_id)"
+        ))
+        print(f"Removed {likes.rowcount} duplicate likes and {blocks.rowcount} duplicate blocks")
+
+
+def create_indexes():
+    """Create the lookup indexes, without locking writes on PostgreSQL"""
+    remove_duplicate_pairs()
+
+    postgres = db.engine.dialect.name == "postgresql"
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for name, table, columns, unique in INDEXES:
+            print(f"Creating index {name} on {table}...")
+            conn.execute(text(
+                f"CREATE {'UNIQUE ' if unique else ''}INDEX "
+                f"{'CONCURRENTLY ' if postgres else ''}IF NOT EXISTS {name} ON {table} ({columns})"
+            ))
+
+
+def migrate():
+    """Run all migration steps"""
+    with app.app_context():
+        convert_photos()
+        add_username_column()
+        add_profile_pic_file_id_column()
+        create_indexes()
+
+        print("Database migrated successfully!")
+
+
+if __name__ == "__main__":
+    migrate()
@@ -7,8 +7,8 @@ Database models for the GBI Match Maker
 
 import os
 from datetime import datetime
-from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, Boolean, ForeignKey, Table
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, Boolean, ForeignKey, Table, LargeBinary, Index
+from sqlalchemy.orm import relationship, deferred
 
 from app import db
 
@@ -19,6 +19,7 @@ class User(db.Model):
     
     id = Column(Integer, primary_key=True)
     telegram_id = Column(BigInteger, unique=True, nullable=False)
+    username = Column(String(100), nullable=True, index=True)  # Telegram username, used for secret crush lookups
     name = Column(String(100), nullable=False)
     age = Column(Integer, nullable=False)
     gender = Column(String(20), nullable=False)  # 'male' or 'female'
@@ -27,27 +28,34 @@ class User(db.Model):
     hobbies = Column(Text, nullable=True)
     relationship_preference = Column(String(50), nullable=True)  # 'serious', 'casual', etc.
     profile_pic_url = Column(String(255), nullable=True)
-    profile_pic = Column(Text, nullable=True)  # Storing image as hex encoded string
+    profile_pic = deferred(Column(LargeBinary, nullable=True))  # Raw image bytes (BYTEA), only loaded when accessed
+    profile_pic_file_id = Column(String(255), nullable=True)  # Telegram file_id, lets the photo be re-sent without uploading
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
-    target_universities = relationship("TargetUniversity", back_populates="user")
-    sent_likes = relationship("Like", foreign_keys="Like.sender_id", back_populates="sender")
-    received_likes = relationship("Like", foreign_keys="Like.receiver_id", back_populates="receiver")
-    sent_messages = relationship("Message", foreign_keys="Message.sender_id", back_populates="sender")
-    received_messages = relationship("Message", foreign_keys="Message.receiver_id", back_populates="receiver")
-    sent_crushes = relationship("SecretCrush", foreign_keys="SecretCrush.crusher_id", back_populates="crusher")
-    received_crushes = relationship("SecretCrush", foreign_keys="SecretCrush.crushee_id", back_populates="crushee")
-    blocks_sent = relationship("Block", foreign_keys="Block.blocker_id", back_populates="blocker")
-    blocks_received = relationship("Block", foreign_keys="Block.blocked_id", back_populates="blocked")
-    reports_sent = relationship("Report", foreign_keys="Report.reporter_id", back_populates="reporter")
-    reports_received = relationship("Report", foreign_keys="Report.reported_id", back_populates="reported")
+    # Target universities are read with every profile, so they are batch loaded
+    # with the users; the other collections are never traversed and raise if a
+    # query touches them without loading them explicitly
+    target_universities = relationship("TargetUniversity", back_populates="user", lazy="selectin")
+    sent_likes = relationship("Like", foreign_keys="Like.sender_id", back_populates="sender", lazy="raise")
+    received_likes = relationship("Like", foreign_keys="Like.receiver_id", back_populates="receiver", lazy="raise")
+    sent_messages = relationship("Message", foreign_keys="Message.sender_id", back_populates="sender", lazy="raise")
+    received_messages = relationship("Message", foreign_keys="Message.receiver_id", back_populates="receiver", lazy="raise")
+    sent_crushes = relationship("SecretCrush", foreign_keys="SecretCrush.crusher_id", back_populates="crusher", lazy="raise")
+    received_crushes = relationship("SecretCrush", foreign_keys="SecretCrush.crushee_id", back_populates="crushee", lazy="raise")
+    blocks_sent = relationship("Block", foreign_keys="Block.blocker_id", back_populates="blocker", lazy="raise")
+    blocks_received = relationship("Block", foreign_keys="Block.blocked_id", back_populates="blocked", lazy="raise")
+    reports_sent = relationship("Report", foreign_keys="Report.reporter_id", back_populates="reporter", lazy="raise")
+    reports_received = relationship("Report", foreign_keys="Report.reported_id", back_populates="reported", lazy="raise")
 
 # Target Universities model
 class TargetUniversity(db.Model):
     """Model for storing user's target universities preferences"""
     __tablename__ = 'target_universities'
+    __table_args__ = (
+        Index('ix_target_univ_user', 'user_id'),
+    )
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
@@ -58,6 +66,10 @@ class TargetUniversity(db.Model):
 class Like(db.Model):
     """Model for storing likes between users"""
     __tablename__ = 'likes'
+    __table_args__ = (
+        Index('uq_like_pair', 'sender_id', 'receiver_id', unique=True),
+        Index('ix_like_receiver_sender', 'receiver_id', 'sender_id', 'is_match'),
+    )
     
     id = Column(Integer, primary_key=True)
     sender_id = Column(Integer, ForeignKey('users.id'), nullable=False)
@@ -72,6 +84,9 @@ class Like(db.Model):
 class Message(db.Model):
     """Model for storing messages between matched users"""
     __tablename__ = 'messages'
+    __table_args__ = (
+        Index('ix_msg_pair', 'sender_id', 'receiver_id', 'created_at'),
+    )
     
     id = Column(Integer, primary_key=True)
     sender_id = Column(Integer, ForeignKey('users.id'), nullable=False)
@@ -87,13 +102,16 @@ class Message(db.Model):
 class SecretCrush(db.Model):
     """Model for storing secret crushes between users"""
     __tablename__ = 'secret_crushes'
+    __table_args__ = (
+        Index('ix_crush_pair', 'crusher_id', 'crushee_id'),
+    )
     
     id = Column(Integer, primary_key=True)
     crusher_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     crushee_id = Column(Integer, ForeignKey('users.id'), nullable=True)  # Can be null for external crushes
     crush_name = Column(String(100), nullable=True)  # Name of the crush if not a user
     social_media_account = Column(String(100), nullable=True)  # Instagram or Telegram handle
-    crush_photo = Column(Text, nullable=True)  # Photo stored as hex encoded string
+    crush_photo = Column(LargeBinary, nullable=True)  # Raw photo bytes (BYTEA)
     is_mutual = Column(Boolean, default=False)  # True when mutual crush exists
     created_at = Column(DateTime, default=datetime.utcnow)
     
@@ -104,6 +122,9 @@ class SecretCrush(db.Model):
 class Block(db.Model):
     """Model for storing blocked users"""
     __tablename__ = 'blocks'
+    __table_args__ = (
+        Index('ix_block_pair', 'blocker_id', 'blocked_id', unique=True),
+    )
     
     id = Column(Integer, primary_key=True)
     blocker_id = Column(Integer, ForeignKey('users.id'), nullable=False)
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Paced delivery of outbound notifications within Telegram's rate limits
+"""
+
+import asyncio
+import logging
+from io import BytesIO
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from telegram.error import RetryAfter
+
+# Enable logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+
+logger = logging.getLogger(__name__)
+
+# Telegram allows about 30 messages per second overall and 1 per second per chat
+GLOBAL_SEND_INTERVAL = 1 / 30
+CHAT_SEND_INTERVAL = 1.0
+
+
+class Outbox:
+    """Queues sends to other users and spaces them out so bursts don't hit flood limits."""
+
+    def __init__(self, global_interval: float = GLOBAL_SEND_INTERVAL, chat_interval: float = CHAT_SEND_INTERVAL):
+        self.global_interval = global_interval
+        self.chat_interval = chat_interval
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._next_global_slot = 0.0
+        self._next_chat_slot: Dict[int, float] = {}  # chat_id -> earliest time of its next send
+        self._chat_delay: Dict[int, float] = {}  # chat_id -> total flood-limit wait imposed on the chat
+        self._deliveries = set()  # Running delivery tasks, referenced until they finish
+
+    def send(self, chat_id: int, method: Callable, /, on_sent: Optional[Callable[[Any], Awaitable[None]]] = None, **kwargs) -> None:
+        """
+        Queue a Bot API call to a chat and return without waiting for it.
+
+        Handlers run one update at a time, so they must not wait for a paced
+        send; delivery failures are logged by the sender instead.
+
+        Args:
+            chat_id: The chat the message goes to (used for per-chat pacing)
+            method: The bot method to call, e.g. context.bot.send_message
+            on_sent: Optional coroutine function called with the result once delivered
+            kwargs: Arguments for the bot method
+        """
+        # Start the sender loop lazily on the bot's running event loop
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._sender_loop())
+
+        self._queue.put_nowait((chat_id, method, kwargs, on_sent))
+
+    async def drain(self) -> None:
+        """Wait until every queued send has been delivered (call before stopping the bot)."""
+        if self._queue is not None:
+            await self._queue.join()
+        while self._deliveries:
+            await asyncio.gather(*self._deliveries, return_exceptions=True)
+
+    def _reserve_slot(self, chat_id: int, now: float) -> float:
+        """Reserve the earliest send time that respects both the global and the per-chat limit."""
+        start = max(now, self._next_global_slot, self._next_chat_slot.get(chat_id, 0.0))
+        self._next_global_slot = start + self.global_interval
+        self._next_chat_slot[chat_id] = start + self.chat_interval
+
+        # Forget chats whose slot has passed so the table doesn't grow forever
+        if len(self._next_chat_slot) > 1000:
+            self._next_chat_slot = {cid: slot for cid, slot in self._next_chat_slot.items() if slot > now}
+            self._chat_delay = {cid: d for cid, d in self._chat_delay.items() if cid in self._next_chat_slot}
+
+        return start
+
+    async def _sender_loop(self) -> None:
+        """Hand each queued send its time slot; sends to different chats run concurrently."""
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            now = loop.time()
+            start = self._reserve_slot(item[0], now)
+            task = asyncio.create_task(self._deliver(item, start - now, self._chat_delay.get(item[0], 0.0)))
+            self._deliveries.add(task)
+            task.add_done_callback(self._deliveries.discard)
+            self._queue.task_done()
+
+    async def _deliver(self, item: Tuple[int, Callable, Dict[str, Any], Optional[Callable]], delay: float,
+                       chat_delay: float) -> None:
+        """Wait for the send's slot, then make the call (retrying once if Telegram asks us to wait)."""
+        chat_id, method, kwargs, on_sent = item
+        if delay > 0:
+            await asyncio.sleep(delay)
+        # Sends to a chat that hit a flood limit after this one was scheduled wait as
+        # long as the retry does, so the chat's messages stay in order
+        while self._chat_delay.get(chat_id, 0.0) > chat_delay:
+            extra = self._chat_delay[chat_id] - chat_delay
+            chat_delay = self._chat_delay[chat_id]
+            await asyncio.sleep(extra)
+
+        try:
+            try:
+                result = await method(**kwargs)
+            except RetryAfter as e:
+                logger.warning(f"Flood limit hit sending to {chat_id}, retrying in {e.retry_after}s")
+                # Push back everything else queued for this chat by the same amount
+                self._chat_delay[chat_id] = self._chat_delay.get(chat_id, 0.0) + e.retry_after
+                self._next_chat_slot[chat_id] = max(
+                    self._next_chat_slot.get(chat_id, 0.0) + e.retry_after,
+                    asyncio.get_running_loop().time() + e.retry_after + self.chat_interval
+                )
+                await asyncio.sleep(e.retry_after)
+                # The first attempt read any file objects to the end; rewind them for the upload
+                for value in kwargs.values():
+                    if isinstance(value, BytesIO):
+                        value.seek(0)
+                result = await method(**kwargs)
+
+            if on_sent is not None:
+                await on_sent(result)
+        except Exception as e:
+            logger.error(f"Error sending to {chat_id}: {e}", exc_info=True)
+
+
+outbox = Outbox()
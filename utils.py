@@ -5,12 +5,31 @@
 Utility functions for the bot
 """
 
+import asyncio
 import re
+from functools import partial
 from io import BytesIO
 from typing import Dict, Any, Optional, Tuple, Union
 from telegram import Update, Message, InlineKeyboardMarkup
+from telegram.constants import ParseMode
 from telegram.ext import ContextTypes
-from data_store import get_user_profile
+from outbox import outbox
+from data_store import get_user_profile_async, get_user_profiles_bulk_async, get_profile_pic, save_profile_pic_file_id
+
+
+_MD = ParseMode.MARKDOWN
+
+
+class CustomUpdate:
+    """Stand-in for an Update when a profile is sent to a chat other than the current update's."""
+    
+    def __init__(self, bot, chat_id: int):
+        self.bot = bot
+        self.chat_id = chat_id
+
+
+# Ages 18-30 written with ASCII digits only (str.isdigit also accepts other scripts)
+_AGE_RE = re.compile(r"(1[89]|2[0-9]|30)\Z")
 
 
 def is_valid_age(age_text: str) -> bool:
@@ -20,11 +39,7 @@ def is_valid_age(age_text: str) -> bool:
     - Must be numeric
     - Must be between 18 and 30 inclusive
     """
-    if not age_text.isdigit():
-        return False
-    
-    age = int(age_text)
-    return 18 <= age <= 30
+    return _AGE_RE.match(age_text) is not None
 
 
 def format_profile(profile: Dict[str, Any], include_personal: bool = True) -> str:
@@ -38,6 +53,16 @@ def format_profile(profile: Dict[str, Any], include_personal: bool = True) -> st
     Returns:
         A formatted string representation of the profile
     """
+    # Rendered text is kept on the profile until the next remember_user_profile
+    cache = profile.setdefault("_formatted", {})
+    formatted = cache.get(include_personal)
+    if formatted is None:
+        formatted = cache[include_personal] = _render_profile(profile, include_personal)
+    return formatted
+
+
+def _render_profile(profile: Dict[str, Any], include_personal: bool) -> str:
+    """Build the Markdown text shown for a profile."""
     formatted = ""
     
     if include_personal:
@@ -58,27 +83,66 @@ def format_profile(profile: Dict[str, Any], include_personal: bool = True) -> st
     return formatted
 
 
-def get_profile_picture(profile: Dict[str, Any]) -> Optional[BytesIO]:
+def _photo_to_bytesio(photo: Any) -> Optional[BytesIO]:
+    """Wrap stored profile picture data in a BytesIO object."""
+    if not photo:
+        return None
+    
+    if isinstance(photo, (bytes, bytearray, memoryview)):
+        return BytesIO(photo)
+    
+    # Legacy profiles may still hold a hex encoded string
+    try:
+        return BytesIO(bytes.fromhex(photo))
+    except Exception:
+        return None
+
+
+async def get_profile_photo(profile: Dict[str, Any]) -> Union[str, BytesIO, None]:
     """
-    Get a user's profile picture as a BytesIO object.
+    Get a user's profile picture in the cheapest form Telegram accepts.
     
     Args:
         profile: The user profile dictionary
     
     Returns:
-        BytesIO object containing the profile picture, or None if no picture
+        The Telegram file_id of the uploaded photo if known (no re-upload needed),
+        otherwise a BytesIO of the stored picture, or None if no picture
     """
-    if "profile_pic" in profile and profile["profile_pic"]:
-        try:
-            photo_bytes = bytes.fromhex(profile["profile_pic"])
-            return BytesIO(photo_bytes)
-        except Exception:
-            return None
-    return None
+    file_id = profile.get("profile_pic_file_id")
+    if file_id:
+        return file_id
+    
+    photo = profile.get("profile_pic")
+    if photo is None and profile.get("telegram_id"):
+        # Loading the photo is a database query, so keep it off the event loop
+        photo = await asyncio.to_thread(get_profile_pic, profile["telegram_id"])
+    return _photo_to_bytesio(photo)
+
+
+async def remember_photo_file_id(profile: Dict[str, Any], message: Optional[Message]) -> None:
+    """
+    Keep the file_id Telegram assigned to a freshly uploaded profile picture.
+    
+    Later sends of the same photo then pass the file_id instead of uploading
+    the bytes again.
+    
+    Args:
+        profile: The profile whose picture was sent
+        message: The message returned by send_photo/reply_photo
+    """
+    if profile.get("profile_pic_file_id") or not profile.get("telegram_id"):
+        return
+    if not message or not message.photo:
+        return
+    
+    file_id = message.photo[-1].file_id
+    profile["profile_pic_file_id"] = file_id
+    await asyncio.to_thread(save_profile_pic_file_id, profile["telegram_id"], file_id)
 
 
 async def send_profile_with_photo(
-    update: Update, 
+    update: Union[Update, CustomUpdate], 
     profile: Dict[str, Any], 
     caption: Optional[str] = None, 
     reply_markup: Optional[InlineKeyboardMarkup] = None,
@@ -88,7 +152,7 @@ async def send_profile_with_photo(
     Send a profile with its photo.
     
     Args:
-        update: The update object
+        update: The update object, or a CustomUpdate to send to another chat
         profile: The user profile dictionary
         caption: Optional caption to use instead of the formatted profile
         reply_markup: Optional inline keyboard markup
@@ -100,47 +164,41 @@ async def send_profile_with_photo(
     if not caption:
         caption = format_profile(profile, include_personal=include_personal)
     
-    photo_io = get_profile_picture(profile)
-    
-    # Check if this is a regular Update or our CustomUpdate
-    is_custom_update = not hasattr(update, 'effective_message') and hasattr(update, 'message')
+    photo = await get_profile_photo(profile)
     
-    if photo_io:
-        if is_custom_update:
-            # This is a CustomUpdate with a direct bot reference
-            chat_id = update.effective_chat.id if hasattr(update, 'effective_chat') else update.message.chat_id
-            return await update.message.reply_photo(
-                chat_id=chat_id,
-                photo=photo_io,
-                caption=caption,
-                reply_markup=reply_markup,
-                parse_mode="Markdown"
-            )
-        else:
-            # Regular update
-            return await update.message.reply_photo(
-                photo=photo_io,
-                caption=caption,
-                reply_markup=reply_markup,
-                parse_mode="Markdown"
-            )
-    else:
-        if is_custom_update:
-            # This is a CustomUpdate with a direct bot reference
-            chat_id = update.effective_chat.id if hasattr(update, 'effective_chat') else update.message.chat_id
-            return await update.message.reply_text(
-                chat_id=chat_id,
+    if isinstance(update, CustomUpdate):
+        # Sending to a chat outside the current update, straight through the bot
+        if not photo:
+            return await update.bot.send_message(
+                chat_id=update.chat_id,
                 text=caption,
                 reply_markup=reply_markup,
-                parse_mode="Markdown"
+                parse_mode=_MD
             )
-        else:
-            # Regular update
+        message = await update.bot.send_photo(
+            chat_id=update.chat_id,
+            photo=photo,
+            caption=caption,
+            reply_markup=reply_markup,
+            parse_mode=_MD
+        )
+    else:
+        # Regular update: reply to its message
+        if not photo:
             return await update.message.reply_text(
                 caption,
                 reply_markup=reply_markup,
-                parse_mode="Markdown"
+                parse_mode=_MD
             )
+        message = await update.message.reply_photo(
+            photo=photo,
+            caption=caption,
+            reply_markup=reply_markup,
+            parse_mode=_MD
+        )
+    
+    await remember_photo_file_id(profile, message)
+    return message
 
 
 async def check_if_registered(update: Update, user_id: int) -> bool:
@@ -150,7 +208,7 @@ async def check_if_registered(update: Update, user_id: int) -> bool:
     Returns:
         True if the user is registered, False otherwise
     """
-    user_profile = get_user_profile(user_id)
+    user_profile = await get_user_profile_async(user_id)
     
     if not user_profile or not user_profile.get("profile_complete"):
         await update.message.reply_text(
@@ -171,8 +229,10 @@ async def send_mutual_crush_notification(context, user_id: int, crush_id: int) -
         user_id: The ID of the first user
         crush_id: The ID of the second user (crush)
     """
-    user_profile = get_user_profile(user_id)
-    crush_profile = get_user_profile(crush_id)
+    # Both profiles come from one lookup (a single IN query if either isn't in memory)
+    profiles = await get_user_profiles_bulk_async([user_id, crush_id])
+    user_profile = profiles.get(user_id)
+    crush_profile = profiles.get(crush_id)
     
     if not user_profile or not crush_profile:
         return
@@ -188,35 +248,33 @@ async def send_mutual_crush_notification(context, user_id: int, crush_id: int) -
                f"You both like each other. Why not start a conversation?"
     
     # Get profile pictures
-    user_photo = get_profile_picture(user_profile)
-    crush_photo = get_profile_picture(crush_profile)
-    
-    # Send notification to user with crush's photo
-    if crush_photo:
-        await context.bot.send_photo(
-            chat_id=user_id,
-            photo=crush_photo,
-            caption=user_msg,
-            parse_mode="Markdown"
-        )
-    else:
-        await context.bot.send_message(
-            chat_id=user_id,
-            text=user_msg,
-            parse_mode="Markdown"
-        )
+    user_photo, crush_photo = await asyncio.gather(
+        get_profile_photo(user_profile),
+        get_profile_photo(crush_profile)
+    )
     
-    # Send notification to crush with user's photo
-    if user_photo:
-        await context.bot.send_photo(
-            chat_id=crush_id,
-            photo=user_photo,
-            caption=crush_msg,
-            parse_mode="Markdown"
+    # Queue both notifications, each with the other person's photo if available
+    _send_crush_match_message(context, user_id, user_msg, crush_profile, crush_photo)
+    _send_crush_match_message(context, crush_id, crush_msg, user_profile, user_photo)
+
+
+def _send_crush_match_message(context, chat_id: int, text: str, photo_profile: Dict[str, Any], photo) -> None:
+    """Queue a mutual crush notification, as a photo caption when there is a photo."""
+    if photo:
+        outbox.send(
+            chat_id,
+            context.bot.send_photo,
+            on_sent=partial(remember_photo_file_id, photo_profile),
+            chat_id=chat_id,
+            photo=photo,
+            caption=text,
+            parse_mode=_MD
         )
     else:
-        await context.bot.send_message(
-            chat_id=crush_id,
-            text=crush_msg,
-            parse_mode="Markdown"
+        outbox.send(
+            chat_id,
+            context.bot.send_message,
+            chat_id=chat_id,
+            text=text,
+            parse_mode=_MD
         )
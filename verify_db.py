@@ -1,18 +1,17 @@
+from sqlalchemy import func, select
 from app import db, app
 from models import User
-import json
+import orjson
+
+# Every users column except the photo blob
+SAMPLE_COLUMNS = [c for c in User.__table__.columns if c.name != 'profile_pic']
 
 with app.app_context():
-    users = db.session.query(User).all()
-    print('Number of users:', len(users))
-    if users and len(users) > 0:
-        user_data = {}
-        for c in User.__table__.columns:
-            value = getattr(users[0], c.name)
-            if isinstance(value, bytes) or str(type(value)).startswith('<class'):
-                user_data[c.name] = str(type(value))
-            else:
-                user_data[c.name] = value
-        print('First user columns:', json.dumps(user_data))
+    count = db.session.scalar(select(func.count(User.id)))
+    print('Number of users:', count)
+    if count:
+        # Only the first user is shown, and only its plain columns
+        row = db.session.execute(select(*SAMPLE_COLUMNS).order_by(User.id).limit(1)).first()
+        print('First user columns:', orjson.dumps(row._asdict()).decode())
     else:
-        print('No users')
\ No newline at end of file
+        print('No users')
@@ -5,10 +5,16 @@
 WSGI entry point for the GBI Match Maker
 """
 
+import asyncio
+import atexit
+import hashlib
 import logging
 import threading
 import os
-from bot import setup_bot
+from flask import request, abort
+from telegram import Update
+from bot import setup_bot, flush_chat_messages
+from outbox import outbox
 from app import app  # Import Flask app for gunicorn
 
 # Enable logging
@@ -19,21 +25,111 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+# Telegram pushes updates to this route instead of the bot polling for them
+WEBHOOK_PATH = "/telegram/webhook"
 
-def run_bot():
-    """Start the Telegram bot in a separate thread."""
+
+def get_app_url():
+    """Get the public URL Telegram should deliver updates to."""
+    app_url = os.environ.get('APP_URL')
+    if not app_url:
+        # If APP_URL is not set, try to use common Render URL pattern with app name
+        app_name = os.environ.get('RENDER_SERVICE_NAME', 'gbi-match-maker')
+        app_url = f"https://{app_name}.onrender.com"
+    return app_url.rstrip("/")
+
+
+def get_webhook_secret():
+    """Get the secret Telegram sends with every webhook request."""
+    secret = os.environ.get("TELEGRAM_WEBHOOK_SECRET")
+    if not secret:
+        # Derive a stable secret from the bot token so every worker agrees on it
+        token = os.environ.get("TELEGRAM_BOT_TOKEN", "")
+        secret = hashlib.sha256(token.encode()).hexdigest()
+    return secret
+
+
+async def start_bot(bot_app):
+    """Start the bot and point Telegram's webhook at this server."""
+    await bot_app.initialize()
+    await bot_app.start()
+    await bot_app.bot.set_webhook(
+        url=f"{get_app_url()}{WEBHOOK_PATH}",
+        secret_token=get_webhook_secret()
+    )
+    logger.info("Bot is running with a webhook")
+
+
+async def stop_bot(bot_app):
+    """Stop the bot and write out any chat messages still buffered in memory."""
+    # Deliver notifications still waiting for their slot while the bot can send
+    await outbox.drain()
+    await bot_app.stop()
+    await bot_app.shutdown()
+    await flush_chat_messages()
+
+
+def stop_bot_at_exit(bot_app, bot_loop):
+    """Shut the bot down on its loop before the process exits."""
     try:
-        logger.info("Starting the Telegram bot...")
-        bot_app = setup_bot()
-        bot_app.run_polling()
+        asyncio.run_coroutine_threadsafe(stop_bot(bot_app), bot_loop).result(timeout=30)
+    except Exception as e:
+        logger.error(f"Error stopping bot: {e}", exc_info=True)
+    bot_loop.call_soon_threadsafe(bot_loop.stop)
+
+
+def telegram_webhook():
+    """Receive an update pushed by Telegram and queue it for the bot."""
+    if request.headers.get("X-Telegram-Bot-Api-Secret-Token") != app.config["TELEGRAM_WEBHOOK_SECRET"]:
+        abort(403)
+
+    bot_app, bot_loop = app.extensions["telegram_bot"]
+    update = Update.de_json(request.get_json(force=True), bot_app.bot)
+    asyncio.run_coroutine_threadsafe(bot_app.update_queue.put(update), bot_loop)
+    return "", 200
+
+
+def start_bot_once():
+    """
+    Start the bot and its webhook route, at most once per process.
+
+    Set RUN_BOT=0 to serve only the web pages, e.g. when the bot runs as its
+    own service (bot_only.py). Under gunicorn this is called from the
+    post_fork hook in gunicorn.conf.py, which only starts the bot when a
+    single worker is configured.
+    """
+    if os.environ.get("RUN_BOT", "1") != "1":
+        logger.info("RUN_BOT is disabled; not starting the Telegram bot")
+        return
+    if getattr(app, "_bot_started", False):
+        return
+    app._bot_started = True
+
+    logger.info("Starting the Telegram bot...")
+    bot_app = setup_bot()
+
+    # The bot's handlers run on their own event loop; Flask threads hand updates to it
+    bot_loop = asyncio.new_event_loop()
+    bot_thread = threading.Thread(target=bot_loop.run_forever, daemon=True)
+    bot_thread.start()
+
+    try:
+        asyncio.run_coroutine_threadsafe(start_bot(bot_app), bot_loop).result()
     except Exception as e:
         logger.error(f"Error running bot: {e}", exc_info=True)
+        return
+
+    app.config["TELEGRAM_WEBHOOK_SECRET"] = get_webhook_secret()
+    app.extensions["telegram_bot"] = (bot_app, bot_loop)
+    app.add_url_rule(WEBHOOK_PATH, view_func=telegram_webhook, methods=["POST"])
+    # Nothing else stops the Application in webhook mode, so do it on exit
+    atexit.register(stop_bot_at_exit, bot_app, bot_loop)
 
 
-# Start the bot in a separate thread when loaded by gunicorn
-bot_thread = threading.Thread(target=run_bot)
-bot_thread.daemon = True  # Make thread a daemon so it exits when main thread exits
-bot_thread.start()
+# gunicorn starts the bot from post_fork instead, so a --preload master never
+# starts a bot thread that would not survive the fork
+if os.environ.get("BOT_STARTED_BY_GUNICORN") != "1":
+    start_bot_once()
 
 # Export the Flask app for gunicorn
-application = app
\ No newline at end of file
+application = app